@@ -1,13 +1,19 @@
 import streamlit as st
-import tempfile
-import os
-from pdf_utils import extract_text_from_pdf
-from llm_utils import extract_key_value_pairs
-from docx_utlis import fill_docx_template
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pdf_utils import extract_text_from_pdf, OCR_DPI, ocr_cache
+from cache_utils import format_stats, make_key
+from llm_utils import extract_key_value_pairs_with_rules, is_api_error, llm_cache, RULES_ONLY_REPLY, MAX_CHUNK_TOKENS, MAX_CONCURRENT_REQUESTS, MERGE_POLICIES
+from docx_utlis import compile_template
+from prefilter import prefilter_text
+from metrics_utils import PipelineMetrics, format_metrics
 import pytesseract
 
 pytesseract.pytesseract.tesseract_cmd = r'C:\\Program Files\\Tesseract-OCR\\tesseract.exe'
 
+# PDFs extracted at once; each one holds its bytes and rendered pages in memory
+MAX_PDF_WORKERS = 4
+
 st.set_page_config(page_title="GLR Insurance Template Filler", page_icon="📝", layout="centered")
 
 # Sidebar
@@ -46,56 +52,173 @@ tt_models = {
 model_choice = st.selectbox("Choose LLM Model", list(tt_models.keys()), index=0)
 model = tt_models[model_choice]
 
+with st.expander("Advanced settings"):
+    ocr_dpi = st.number_input("OCR resolution (DPI) for image-only pages", min_value=72, max_value=600, value=OCR_DPI, step=50)
+    use_ocr_cache = st.checkbox("Reuse cached text for unchanged PDF pages", value=True)
+    use_llm_cache = st.checkbox("Reuse cached LLM responses for identical text and model", value=True)
+    use_prefilter = st.checkbox("Send only passages relevant to the template fields to the LLM", value=True)
+    use_rules = st.checkbox("Fill clearly labelled fields (policy #, dates, names, addresses) without the LLM", value=True)
+    max_chunk_tokens = st.number_input("Max tokens of report text per LLM request (larger reports are split)", min_value=500, max_value=100000, value=MAX_CHUNK_TOKENS, step=500)
+    max_concurrency = st.number_input("Max concurrent LLM requests", min_value=1, max_value=16, value=MAX_CONCURRENT_REQUESTS)
+    merge_policy = st.selectbox("When chunks disagree on a value, keep", MERGE_POLICIES, index=0)
+
+# Stage outputs of earlier runs, each stored with a key built from that stage's inputs.
+# Streamlit reruns this script on every interaction; only stages whose key changed run again.
+if "glr" not in st.session_state:
+    st.session_state.glr = {}
+session = st.session_state.glr
+
+
+def upload_hash(upload):
+    return make_key("upload", upload.getvalue())
+
+
+extract_key = llm_key = template_hash = None
+if template_file and pdf_files:
+    template_hash = upload_hash(template_file)
+    extract_key = make_key("extract", ocr_dpi, *(part for pdf in pdf_files for part in (pdf.name, upload_hash(pdf))))
+    llm_key = make_key("llm", extract_key, template_hash, model, use_rules, use_prefilter, max_chunk_tokens, merge_policy)
+
+run_metrics = None
 if st.button("Process and Fill Template"):
     if not template_file or not pdf_files or not api_key:
         st.error("Please upload a DOCX template, at least one PDF, and enter your API key.")
     else:
-        with st.spinner("Extracting text from PDF photo reports..."):
-            all_text = ""
-            for pdf in pdf_files:
-                text, warnings = extract_text_from_pdf(pdf)
-                if warnings:
-                    for w in warnings:
-                        st.warning(f"{pdf.name}: {w}")
-                if not text:
-                    st.warning(f"No text extracted from {pdf.name}. Skipping.")
-                else:
-                    all_text += f"\n---\n{pdf.name}:\n{text}"
-            if not all_text.strip():
-                st.error("No text could be extracted from any PDF. Please check your files.")
-                st.stop()
-        st.success("Text extraction complete.")
-
-        with st.spinner("Extracting key-value pairs using LLM..."):
-            key_value_pairs, raw_llm_response = extract_key_value_pairs(all_text, api_key, model=model)
-            if not key_value_pairs:
-                st.error("LLM could not extract key-value pairs. Please check your API key, model selection, or try again.")
-                with st.expander("Show raw LLM response / error details"):
-                    st.code(raw_llm_response)
-                st.stop()
-        st.success("Key-value extraction complete.")
-
-        st.header("2. Extracted Key-Value Pairs")
-        st.json(key_value_pairs)
-
-        with st.spinner("Filling DOCX template..."):
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".docx") as tmp_out:
-                success = fill_docx_template(template_file, key_value_pairs, tmp_out.name)
-                if not success:
-                    st.error("Failed to fill the DOCX template. Please check your template and try again.")
+        run_metrics = metrics = PipelineMetrics(template_file.name, model=model, pdfs=[pdf.name for pdf in pdf_files])
+        if session.get("extract", {}).get("key") == extract_key:
+            st.caption("PDFs and OCR settings unchanged: reusing the extracted text.")
+        else:
+            with st.spinner("Extracting text from PDF photo reports..."), metrics.timer("extract"):
+                all_text = ""
+                ocr_stats_before = ocr_cache.stats.copy()
+                # PDFs are extracted concurrently; OCR work itself runs in pdf_utils' process pool
+                with ThreadPoolExecutor(max_workers=min(len(pdf_files), MAX_PDF_WORKERS)) as pool:
+                    results = list(pool.map(
+                        lambda pdf: extract_text_from_pdf(pdf, dpi=ocr_dpi, use_cache=use_ocr_cache, metrics=metrics), pdf_files))
+                for pdf, (text, warnings) in zip(pdf_files, results):
+                    if warnings:
+                        for w in warnings:
+                            st.warning(f"{pdf.name}: {w}")
+                    if not text:
+                        st.warning(f"No text extracted from {pdf.name}. Skipping.")
+                    else:
+                        all_text += f"\n---\n{pdf.name}:\n{text}"
+                if not all_text.strip():
+                    st.error("No text could be extracted from any PDF. Please check your files.")
                     st.stop()
-                output_path = tmp_out.name
-        st.success("Template filled successfully!")
+            st.success("Text extraction complete.")
+            if use_ocr_cache:
+                st.caption(format_stats("Page cache", ocr_cache.stats.copy() - ocr_stats_before))
+            session["extract"] = {"key": extract_key, "text": all_text}
 
-        st.header("3. Download Filled Template")
-        with open(output_path, "rb") as f:
+        # Results with a failed LLM request are never reused, so pressing the button retries them
+        if session.get("llm", {}).get("key") == llm_key and not is_api_error(session["llm"]["raw"]):
+            st.caption("Extracted text, template, model and settings unchanged: reusing the extracted key-value pairs.")
+        else:
+            all_text = session["extract"]["text"]
+            # Only the template's placeholders are requested; rule-based values are not asked of the LLM
+            try:
+                template_fields = compile_template(template_file, metrics).placeholders
+            except Exception:
+                template_fields = None  # reported when filling below
+            llm_text = all_text
+            prefilter_stats = None
+            if use_prefilter:
+                with metrics.timer("prefilter"):
+                    llm_text, prefilter_stats = prefilter_text(all_text, fields=template_fields)
+
+            with st.spinner("Extracting key-value pairs using LLM..."):
+                llm_hits_before = llm_cache.stats.hits
+                key_value_pairs, raw_llm_response, rule_details = extract_key_value_pairs_with_rules(
+                    all_text, api_key, fields=template_fields, llm_text=llm_text,
+                    use_rules=use_rules, model=model, max_chunk_tokens=max_chunk_tokens,
+                    max_concurrency=max_concurrency, merge_policy=merge_policy, use_cache=use_llm_cache, metrics=metrics)
+                llm_cached = llm_cache.stats.hits > llm_hits_before
+                if not key_value_pairs:
+                    st.error("LLM could not extract key-value pairs. Please check your API key, model selection, or try again.")
+                    with st.expander("Show raw LLM response / error details"):
+                        st.code(raw_llm_response)
+                    st.stop()
+            st.success("Key-value extraction complete.")
+            session["llm"] = {
+                "key": llm_key,
+                "pairs": key_value_pairs,
+                "raw": raw_llm_response,
+                "cached": llm_cached,
+                "prefilter": prefilter_stats,
+                "rule_fields": [field for field, detail in rule_details.items() if detail["status"] == "ok"],
+            }
+        session["metrics"] = metrics
+
+# Results stay on screen across reruns; editing a value only re-runs the (fast) fill step
+llm_state = session.get("llm")
+if llm_state and template_file:
+    if llm_state["key"] != llm_key:
+        st.info("The uploads or settings changed since these values were extracted. "
+                "Click **Process and Fill Template** to update them; only the affected stages will run again.")
+    prefilter_stats = llm_state["prefilter"]
+    if prefilter_stats:
+        st.caption(f"Prompt pre-filter: {prefilter_stats['tokens_before']:,} → {prefilter_stats['tokens_after']:,} tokens "
+                   f"({prefilter_stats['lines_after']:,} of {prefilter_stats['lines_before']:,} lines kept)")
+    if llm_state["rule_fields"]:
+        st.caption(f"Filled by rules: {', '.join(llm_state['rule_fields'])}")
+    if llm_state["raw"] == RULES_ONLY_REPLY:
+        st.caption(RULES_ONLY_REPLY)
+    elif is_api_error(llm_state["raw"]):
+        st.warning("An LLM request failed, so the extracted values are incomplete. "
+                   f"Click **Process and Fill Template** to retry. ({llm_state['raw'].splitlines()[0]})")
+    if llm_state["cached"]:
+        st.caption("LLM response served from cache. Untick it under Advanced settings to request a fresh one.")
+
+    st.header("2. Extracted Key-Value Pairs")
+    st.caption("Edit values (or add rows) to correct them; the template is re-filled immediately.")
+    extracted = llm_state["pairs"]
+    edited = st.data_editor(
+        {"Field": list(extracted), "Value": ["" if v is None else str(v) for v in extracted.values()]},
+        num_rows="dynamic", key=f"pairs_editor_{llm_state['key']}")
+    if hasattr(edited, "to_dict"):  # returned as a DataFrame by some Streamlit versions
+        edited = edited.to_dict("list")
+    key_value_pairs = {}
+    for field, value in zip(edited["Field"], edited["Value"]):
+        if field is not None and str(field).strip():
+            key_value_pairs[str(field).strip()] = "" if value is None or value != value else value  # None/NaN in new rows
+
+    fill_key = make_key("fill", template_hash, json.dumps(key_value_pairs, sort_keys=True, default=str))
+    if session.get("fill", {}).get("key") != fill_key:
+        try:
+            # Filled in memory; the compiled template is reused across reruns with the same file
+            filled_docx, missing_placeholders = compile_template(template_file, run_metrics).fill(key_value_pairs, run_metrics)
+        except Exception as e:
+            st.error(f"Failed to fill the DOCX template. Please check your template and try again. ({e})")
+            st.stop()
+        session["fill"] = {"key": fill_key, "docx": filled_docx.getvalue(), "missing": missing_placeholders}
+    st.success("Template filled successfully!")
+    if session["fill"]["missing"]:
+        st.warning(f"No extracted value for these placeholders (left as-is): {', '.join(sorted(session['fill']['missing']))}")
+
+    metrics = session.get("metrics")
+    if metrics is not None:
+        with st.expander("Performance details (last processing run)"):
+            st.caption(format_metrics(metrics))
+            st.json(metrics.summary())
+            if metrics.pages:
+                st.dataframe(metrics.pages)
+            if metrics.llm_calls:
+                st.dataframe(metrics.llm_calls)
             st.download_button(
-                label="Download Filled DOCX",
-                data=f,
-                file_name="Filled_Insurance_Template.docx",
-                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+                label="Download metrics (JSON lines)",
+                data=metrics.to_json_line() + "\n",
+                file_name="glr_metrics.jsonl",
+                mime="application/x-ndjson"
             )
-        os.remove(output_path)
+
+    st.header("3. Download Filled Template")
+    st.download_button(
+        label="Download Filled DOCX",
+        data=session["fill"]["docx"],
+        file_name="Filled_Insurance_Template.docx",
+        mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+    )
 
 st.markdown("---")
 st.caption("GLR Pipeline | Powered by Streamlit, OpenRouter, and Python 🐍")
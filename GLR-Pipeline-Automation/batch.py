@@ -0,0 +1,350 @@
+"""
+Headless batch mode for the GLR pipeline.
+
+Each claim folder holds a DOCX template and one or more PDF photo reports.
+Claims move through three stages, each with its own bounded worker pool so
+OCR (CPU-bound), LLM calls (network-bound) and DOCX filling overlap:
+
+    extract (pdf_utils) -> llm (llm_utils) -> fill (docx_utlis)
+
+For every claim the filled DOCX and a result.json are written to
+<output>/<claim>/, and a summary.json is written to <output>/. Per-claim
+metrics (stage and page timings, token usage, retries) are appended to
+<output>/metrics.jsonl, one line per claim, across runs. Claims whose
+result.json already reports "ok" are skipped, so an interrupted run can
+simply be started again.
+
+Usage:
+    python batch.py claims/ --output filled/ --api-key sk-or-...
+    python batch.py claims/ --output filled/ --llm-workers 8 --force
+"""
+import argparse
+import fnmatch
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytesseract
+
+from pdf_utils import extract_text_from_pdf, OCR_DPI
+from llm_utils import extract_key_value_pairs_with_rules, is_api_error, MAX_CHUNK_TOKENS, MERGE_POLICIES
+from docx_utlis import compile_template, fill_docx_template
+from prefilter import prefilter_text
+from metrics_utils import PipelineMetrics, append_jsonl
+
+RESULT_FILE = "result.json"
+SUMMARY_FILE = "summary.json"
+METRICS_FILE = "metrics.jsonl"
+STAGES = ("extract", "llm", "fill")
+
+
+def _excluded(name, exclude):
+    return any(fnmatch.fnmatch(name.lower(), pattern.lower()) for pattern in exclude)
+
+
+def discover_claims(root, exclude=("Completed*",)):
+    """
+    Returns a sorted list of (claim_name, folder, template_path, [pdf_paths]) for every
+    folder under root (including root itself) with exactly one DOCX template and at
+    least one PDF. Files matching an exclude pattern (e.g. completed reference
+    documents) are ignored. Folders with several candidate templates are reported
+    via the second return value instead.
+    """
+    claims = []
+    problems = []
+    for folder, dirs, files in os.walk(root):
+        dirs.sort()
+        docx = sorted(f for f in files if f.lower().endswith(".docx") and not f.startswith("~$") and not _excluded(f, exclude))
+        pdfs = sorted(f for f in files if f.lower().endswith(".pdf") and not _excluded(f, exclude))
+        if not docx or not pdfs:
+            continue
+        name = os.path.relpath(folder, root).replace(os.sep, "__")
+        if name == ".":
+            name = os.path.basename(os.path.abspath(root))
+        if len(docx) > 1:
+            problems.append((name, f"several DOCX templates found: {docx}"))
+            continue
+        claims.append((name, folder, os.path.join(folder, docx[0]), [os.path.join(folder, p) for p in pdfs]))
+    return claims, problems
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _load_result(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class BatchRunner:
+    """
+    Runs claims through the extract -> llm -> fill stages. Each stage has its own
+    thread pool, and a claim is handed to the next stage as soon as it finishes the
+    previous one, so different claims are in different stages at the same time.
+    OCR itself runs in pdf_utils' process pool; LLM calls share http_utils' rate limit.
+    A claim split into chunks sends up to chunk_workers of them at once, so at most
+    llm_workers * chunk_workers LLM requests are in flight.
+    """
+    def __init__(self, output_dir, api_key, model, extract_workers=2, llm_workers=4, fill_workers=2,
+                 dpi=OCR_DPI, max_chunk_tokens=MAX_CHUNK_TOKENS, merge_policy="first", use_cache=True, use_prefilter=True,
+                 use_rules=True, chunk_workers=2):
+        self.output_dir = output_dir
+        self.api_key = api_key
+        self.model = model
+        self.dpi = dpi
+        self.max_chunk_tokens = max_chunk_tokens
+        self.merge_policy = merge_policy
+        self.use_cache = use_cache
+        self.use_prefilter = use_prefilter
+        self.use_rules = use_rules
+        self.pools = {
+            "extract": ThreadPoolExecutor(max_workers=extract_workers, thread_name_prefix="extract"),
+            "llm": ThreadPoolExecutor(max_workers=llm_workers, thread_name_prefix="llm"),
+            "fill": ThreadPoolExecutor(max_workers=fill_workers, thread_name_prefix="fill"),
+        }
+        self.chunk_workers = chunk_workers
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._done = threading.Event()
+        self.results = []
+
+    # --- stages ---
+    def _extract(self, claim, state):
+        name, folder, template, pdfs = claim
+        all_text = ""
+        warnings = []
+        for pdf in pdfs:
+            with open(pdf, "rb") as f:
+                text, pdf_warnings = extract_text_from_pdf(f, dpi=self.dpi, use_cache=self.use_cache,
+                                                           metrics=state["metrics"])
+            pdf_name = os.path.basename(pdf)
+            warnings.extend(f"{pdf_name}: {w}" for w in pdf_warnings)
+            if text:
+                # Same layout as app.py, so chunked extraction can split at report boundaries
+                all_text += f"\n---\n{pdf_name}:\n{text}"
+        if not all_text.strip():
+            raise RuntimeError("No text could be extracted from any PDF.")
+        state.update(text=all_text, warnings=warnings)
+        return state
+
+    def _llm(self, claim, state):
+        name, folder, template, pdfs = claim
+        metrics = state["metrics"]
+        text = state["text"]
+        fields = compile_template(template, metrics).placeholders
+        if self.use_prefilter:
+            with metrics.timer("prefilter"):
+                text, state["prefilter"] = prefilter_text(text, fields=fields)
+        pairs, raw, rule_details = extract_key_value_pairs_with_rules(
+            state["text"], self.api_key, fields=fields, llm_text=text,
+            use_rules=self.use_rules, model=self.model, max_chunk_tokens=self.max_chunk_tokens,
+            max_concurrency=self.chunk_workers, merge_policy=self.merge_policy, use_cache=self.use_cache,
+            metrics=metrics)
+        state["raw_llm_response"] = raw
+        state["rule_fields"] = sorted(field for field, detail in rule_details.items() if detail["status"] == "ok")
+        if not pairs:
+            raise RuntimeError("LLM could not extract key-value pairs.")
+        if is_api_error(raw):
+            # A failed request (or chunk) would leave the claim half filled but marked done
+            raise RuntimeError(raw.split("\n", 1)[0])
+        state["key_value_pairs"] = pairs
+        return state
+
+    def _fill(self, claim, state):
+        name, folder, template, pdfs = claim
+        claim_dir = os.path.join(self.output_dir, name)
+        output_path = os.path.join(claim_dir, f"Filled_{os.path.basename(template)}")
+        if not fill_docx_template(template, state["key_value_pairs"], output_path, metrics=state["metrics"]):
+            raise RuntimeError("Failed to fill the DOCX template.")
+        state["output_docx"] = output_path
+        return state
+
+    # --- plumbing ---
+    def _run_stage(self, stage, claim, state, timings):
+        start = time.perf_counter()
+        try:
+            if stage == "extract":
+                result = self._extract(claim, state)
+            elif stage == "llm":
+                result = self._llm(claim, state)
+            else:
+                result = self._fill(claim, state)
+        finally:
+            timings[stage] = round(time.perf_counter() - start, 3)
+        return result
+
+    def _submit(self, stage, claim, state, timings, started):
+        try:
+            future = self.pools[stage].submit(self._run_stage, stage, claim, state, timings)
+        except RuntimeError as e:  # pools already shut down (interrupted run)
+            self._finish(claim, state, timings, started, stage, e)
+            return
+        future.add_done_callback(lambda f: self._advance(stage, claim, state, timings, started, f))
+
+    def _advance(self, stage, claim, state, timings, started, future):
+        error = RuntimeError("cancelled") if future.cancelled() else future.exception()
+        if error is None:
+            state = future.result()
+            next_index = STAGES.index(stage) + 1
+            if next_index < len(STAGES):
+                self._submit(STAGES[next_index], claim, state, timings, started)
+                return
+        self._finish(claim, state, timings, started, stage if error else None, error)
+
+    def _finish(self, claim, state, timings, started, failed_stage, error):
+        name, folder, template, pdfs = claim
+        result = {
+            "claim": name,
+            "folder": folder,
+            "template": template,
+            "pdfs": pdfs,
+            "model": self.model,
+            "status": "failed" if error else "ok",
+            "failed_stage": failed_stage,
+            "error": str(error) if error else None,
+            "timings": timings,
+            "elapsed": round(time.perf_counter() - started, 3),
+            "warnings": (state or {}).get("warnings", []),
+            "prefilter": (state or {}).get("prefilter"),
+            "rule_fields": (state or {}).get("rule_fields"),
+            "key_value_pairs": (state or {}).get("key_value_pairs"),
+            "output_docx": (state or {}).get("output_docx"),
+            "raw_llm_response": (state or {}).get("raw_llm_response"),
+        }
+        metrics = (state or {}).get("metrics")
+        if metrics is not None:
+            metrics.meta.update(status=result["status"], failed_stage=failed_stage, elapsed=result["elapsed"])
+            result["metrics"] = metrics.summary()
+        try:
+            _write_json(os.path.join(self.output_dir, name, RESULT_FILE), result)
+        except OSError as e:
+            result["error"] = f"{result['error']}; could not write result: {e}"
+        status = "ok" if not error else f"FAILED at {failed_stage}: {error}"
+        print(f"[{name}] {status} ({result['elapsed']:.1f}s)", flush=True)
+        with self._lock:
+            if metrics is not None:
+                try:
+                    append_jsonl(os.path.join(self.output_dir, METRICS_FILE), [metrics])
+                except OSError as e:
+                    print(f"[{name}] could not write metrics: {e}", flush=True)
+            self.results.append(result)
+            self._pending -= 1
+            if self._pending == 0:
+                self._done.set()
+
+    def run(self, claims):
+        if not claims:
+            return self.results
+        with self._lock:
+            self._pending = len(claims)
+        for claim in claims:
+            os.makedirs(os.path.join(self.output_dir, claim[0]), exist_ok=True)
+            # Every stage adds to the claim's state dict and returns it
+            state = {"metrics": PipelineMetrics(claim[0], model=self.model)}
+            self._submit("extract", claim, state, {}, time.perf_counter())
+        self._done.wait()
+        return self.results
+
+    def shutdown(self):
+        for pool in self.pools.values():
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+def summarize(results, skipped, problems, wall_time):
+    ok = [r for r in results if r["status"] == "ok"]
+    failed = [r for r in results if r["status"] != "ok"]
+    stage_totals = {stage: round(sum(r["timings"].get(stage, 0.0) for r in results), 3) for stage in STAGES}
+    counter_totals = {}
+    for r in results:
+        for name, value in (r.get("metrics") or {}).get("counters", {}).items():
+            counter_totals[name] = counter_totals.get(name, 0) + value
+    return {
+        "processed": len(results),
+        "ok": len(ok),
+        "failed": len(failed),
+        "skipped": len(skipped),
+        "invalid_folders": [{"claim": name, "error": error} for name, error in problems],
+        "wall_time": round(wall_time, 3),
+        "claims_per_minute": round(len(results) / wall_time * 60, 2) if wall_time and results else 0.0,
+        "stage_time_totals": stage_totals,
+        "counter_totals": counter_totals,
+        "failures": [{"claim": r["claim"], "stage": r["failed_stage"], "error": r["error"]} for r in failed],
+        "skipped_claims": skipped,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fill GLR templates for every claim folder under a directory.")
+    parser.add_argument("claims_dir", help="Folder containing one sub-folder per claim.")
+    parser.add_argument("--output", default="batch-output", help="Where filled documents and results are written.")
+    parser.add_argument("--api-key", default=os.environ.get("OPENROUTER_API_KEY"), help="Defaults to $OPENROUTER_API_KEY.")
+    parser.add_argument("--model", default="openai/gpt-3.5-turbo")
+    parser.add_argument("--extract-workers", type=int, default=2, help="Claims extracted at once (OCR runs in a process pool).")
+    parser.add_argument("--llm-workers", type=int, default=4, help="Claims sent to the LLM at once.")
+    parser.add_argument("--chunk-workers", type=int, default=2,
+                        help="Chunks of one claim sent to the LLM at once (at most llm-workers x chunk-workers requests in flight).")
+    parser.add_argument("--fill-workers", type=int, default=2)
+    parser.add_argument("--dpi", type=int, default=OCR_DPI)
+    parser.add_argument("--max-chunk-tokens", type=int, default=MAX_CHUNK_TOKENS)
+    parser.add_argument("--merge-policy", choices=MERGE_POLICIES, default="first")
+    parser.add_argument("--exclude", nargs="*", default=["Completed*"], help="File name patterns to ignore when discovering inputs.")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the OCR and LLM caches.")
+    parser.add_argument("--no-prefilter", action="store_true", help="Send the full report text to the LLM.")
+    parser.add_argument("--no-rules", action="store_true", help="Ask the LLM for every field, even clearly labelled ones.")
+    parser.add_argument("--force", action="store_true", help="Re-run claims that already completed.")
+    parser.add_argument("--tesseract-cmd", help="Path to the tesseract executable.")
+    args = parser.parse_args(argv)
+
+    if not args.api_key:
+        parser.error("an OpenRouter API key is required (--api-key or $OPENROUTER_API_KEY)")
+    if args.tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = args.tesseract_cmd
+
+    claims, problems = discover_claims(args.claims_dir, args.exclude)
+    for name, error in problems:
+        print(f"[{name}] skipped: {error}")
+    os.makedirs(args.output, exist_ok=True)
+
+    todo, skipped = [], []
+    for claim in claims:
+        previous = _load_result(os.path.join(args.output, claim[0], RESULT_FILE))
+        if previous and previous.get("status") == "ok" and not args.force:
+            skipped.append(claim[0])
+        else:
+            todo.append(claim)
+    print(f"{len(claims)} claims found, {len(skipped)} already done, {len(todo)} to process.")
+
+    runner = BatchRunner(args.output, args.api_key, args.model, args.extract_workers, args.llm_workers,
+                         args.fill_workers, args.dpi, args.max_chunk_tokens, args.merge_policy, not args.no_cache,
+                         not args.no_prefilter, not args.no_rules, args.chunk_workers)
+    start = time.perf_counter()
+    try:
+        results = runner.run(todo)
+    except KeyboardInterrupt:
+        print("Interrupted; finished claims are saved and will be skipped on the next run.")
+        runner.shutdown()
+        return 130
+    runner.shutdown()
+    summary = summarize(results, skipped, problems, time.perf_counter() - start)
+    _write_json(os.path.join(args.output, SUMMARY_FILE), summary)
+    print(f"Done: {summary['ok']} ok, {summary['failed']} failed, {summary['skipped']} skipped "
+          f"in {summary['wall_time']:.1f}s ({summary['claims_per_minute']} claims/min).")
+    totals = summary["counter_totals"]
+    print(f"{totals.get('pages', 0)} pages ({totals.get('ocr_pages', 0)} OCR'd); {totals.get('llm_requests', 0)} LLM requests, "
+          f"{totals.get('llm_retries', 0)} retries, {totals.get('prompt_tokens', 0):,} prompt + "
+          f"{totals.get('completion_tokens', 0):,} completion tokens. Metrics: {os.path.join(args.output, METRICS_FILE)}")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
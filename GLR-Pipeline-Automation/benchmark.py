@@ -0,0 +1,351 @@
+"""
+End-to-end benchmark for the GLR pipeline, runnable offline.
+
+Runs the claims in Example-Inputs-Outputs (Example1..3) through the same stages
+as the app: extract_text_from_pdf -> prefilter_text -> rule + LLM extraction
+-> template fill. LLM calls go to a local mock_openrouter server with
+configurable latency, whose canned replies are the values found in each
+example's Completed reference document.
+
+Reports per-stage latency, LLM requests and tokens, peak memory and claims/second
+for several concurrency levels. It also checks each filled DOCX against the
+completed reference document, placeholder by placeholder. Pages that fail to OCR
+(e.g. Tesseract not installed) fail the run unless --allow-ocr-failures is given,
+since their OCR timings would not be real.
+
+Usage:
+    python benchmark.py
+    python benchmark.py --workers 1 2 4 8 --latency 0.5 --repeat 3
+    python benchmark.py --skip-throughput --no-rules
+    python benchmark.py --allow-ocr-failures
+"""
+import argparse
+import io
+import math
+import os
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+import zipfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import fitz  # PyMuPDF
+from lxml import etree
+
+import llm_utils
+from batch import discover_claims
+from docx_utlis import compile_template, fill_docx_template, PLACEHOLDER_PATTERN, TEXT_PARTS, W_P, W_T
+from http_utils import OpenRouterClient, set_client
+from llm_utils import extract_key_value_pairs_with_rules, MAX_CHUNK_TOKENS
+from metrics_utils import PipelineMetrics
+from mock_openrouter import MockOpenRouter
+from pdf_utils import extract_text_from_pdf, OCR_DPI
+from prefilter import prefilter_text
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+EXAMPLES_DIR = os.path.join(HERE, "Example-Inputs-Outputs")
+REFERENCE_PATTERN = "Completed*"
+# Template text either side of a placeholder used to find its value in the reference document
+CONTEXT_CHARS = 30
+STAGES = ("text_layer", "ocr", "prefilter", "template_compile", "rules", "llm", "fill")
+
+
+# --- Reference documents ---
+def docx_text(path):
+    """
+    Text of a DOCX path or file-like (body first, then headers/footers/notes), one line per paragraph.
+    """
+    lines = []
+    with zipfile.ZipFile(path) as zf:
+        parts = sorted((n for n in zf.namelist() if TEXT_PARTS.match(n)), key=lambda n: (n != "word/document.xml", n))
+        for part in parts:
+            root = etree.fromstring(zf.read(part))
+            for p in root.iter(W_P):
+                # Text of nested paragraphs (text boxes) belongs to those paragraphs only
+                lines.append("".join(t.text or "" for t in p.iter(W_T) if next(t.iterancestors(W_P)) is p))
+    return "\n".join(lines)
+
+
+def pdf_text(path):
+    with fitz.open(path) as doc:
+        return "\n".join(page.get_text() for page in doc)
+
+
+def document_text(path):
+    return docx_text(path) if path.lower().endswith(".docx") else pdf_text(path)
+
+
+def find_reference(folder):
+    """
+    The completed reference document in a claim folder, preferring DOCX over PDF, or None.
+    """
+    names = sorted(n for n in os.listdir(folder) if re.fullmatch(REFERENCE_PATTERN.replace("*", ".*"), n))
+    for ext in (".docx", ".pdf"):
+        for name in names:
+            if name.lower().endswith(ext):
+                return os.path.join(folder, name)
+    return None
+
+
+def _flexible(literal):
+    # Whitespace may differ between the template and the reference (line wraps, PDF text, ...)
+    return r"\s*".join(re.escape(c) for c in re.sub(r"\s+", "", literal))
+
+
+def placeholder_values(template_text, document):
+    """
+    Value of each template placeholder in a filled-in document (the completed reference,
+    or our output), found by matching the template text around the placeholder.
+    Placeholders without enough literal text around them (e.g. two placeholders side by
+    side) can't be located and are left out. Returns {placeholder: value}, using the most
+    common value when a placeholder occurs several times.
+    """
+    template = re.sub(r"\s+", " ", template_text)
+    reference = re.sub(r"\s+", " ", document)
+    matches = list(PLACEHOLDER_PATTERN.finditer(template))
+    found = {}
+    for n, match in enumerate(matches):
+        key = (match.group(1) if match.group(1) is not None else match.group(2)).strip()
+        previous_end = matches[n - 1].end() if n else 0
+        next_start = matches[n + 1].start() if n + 1 < len(matches) else len(template)
+        before = template[max(previous_end, match.start() - CONTEXT_CHARS):match.start()]
+        after = template[match.end():min(next_start, match.end() + CONTEXT_CHARS)]
+        if len(before.strip()) < 3 or not after.strip():
+            continue
+        located = re.search(_flexible(before) + r"\s*(.{1,120}?)\s*" + _flexible(after), reference, re.I)
+        if located and located.group(1).strip():
+            found.setdefault(key, []).append(located.group(1).strip())
+    return {key: Counter(values).most_common(1)[0][0] for key, values in found.items()}
+
+
+def _same(a, b):
+    return re.sub(r"\s+", " ", str(a)).strip().lower() == re.sub(r"\s+", " ", str(b)).strip().lower()
+
+
+def _letters_and_digits(text):
+    # Punctuation, spacing and case differ between reports and the reference documents
+    return re.sub(r"[\W_]+", "", str(text)).lower()
+
+
+# --- Mock LLM ---
+def make_reply(claims, expected):
+    """
+    Reply function for MockOpenRouter: answers with the reference values of the claim
+    whose reports appear in the prompt, for the fields the prompt asks for.
+    Claims are told apart by the "<pdf name>:" report headers kept in the prompt text:
+    the claim with the most of its reports present and the fewest missing wins.
+    Like a real model, it can only answer from the report text it was sent: a value
+    that isn't in the prompt (e.g. dropped by the prefilter or chunking) comes back "".
+    """
+    def score(claim, prompt):
+        present = sum(f"{os.path.basename(pdf)}:" in prompt for pdf in claim[3])
+        return present - (len(claim[3]) - present)
+
+    def reply(prompt):
+        best = max(claims, key=lambda claim: score(claim, prompt))
+        report = _letters_and_digits(prompt.split("Report Text:", 1)[-1])
+        values = {field: value for field, value in expected.get(best[0], {}).items()
+                  if _letters_and_digits(value) and _letters_and_digits(value) in report}
+        requested = re.search(r"text below: (.*?)\. Return", prompt)
+        if not requested:
+            return values
+        return {field: values.get(field, "") for field in requested.group(1).split(", ")}
+    return reply
+
+
+# --- Pipeline ---
+def run_claim(claim, options):
+    """
+    Runs one claim through the pipeline.
+    Returns (key_value_pairs, filled_docx_bytes, metrics, extraction_warnings).
+    """
+    name, folder, template, pdfs = claim
+    metrics = PipelineMetrics(name)
+    all_text = ""
+    warnings = []
+    for pdf in pdfs:
+        with open(pdf, "rb") as f:
+            text, pdf_warnings = extract_text_from_pdf(f, dpi=options.dpi, use_cache=options.use_cache, metrics=metrics)
+        warnings += [f"{os.path.basename(pdf)}: {w}" for w in pdf_warnings]
+        if text:
+            all_text += f"\n---\n{os.path.basename(pdf)}:\n{text}"
+    fields = compile_template(template, metrics).placeholders
+    llm_text = all_text
+    if not options.no_prefilter:
+        with metrics.timer("prefilter"):
+            llm_text, _ = prefilter_text(all_text, fields=fields)
+    pairs, _, _ = extract_key_value_pairs_with_rules(
+        all_text, "benchmark", fields=fields, llm_text=llm_text, use_rules=not options.no_rules,
+        max_chunk_tokens=options.max_chunk_tokens, use_cache=options.use_cache, metrics=metrics)
+    output = io.BytesIO()
+    fill_docx_template(template, pairs, output, metrics=metrics)
+    return pairs, output.getvalue(), metrics, warnings
+
+
+def report_ocr_failures(metrics, warnings):
+    """
+    Prints the claim's OCR failures, if any. Returns the number of pages that failed.
+    """
+    failed = metrics.counters.get("ocr_failures", 0)
+    if failed:
+        print(f"  {metrics.claim}: {failed} of {metrics.counters['ocr_pages']} OCR pages failed, e.g. "
+              f"{next(w for w in warnings if 'OCR failed' in w)}")
+    return failed
+
+
+def check_references(claims, expected, options):
+    """
+    Prints how many reference values each claim fills correctly.
+    Returns (claims below options.min_score, pages that failed to OCR).
+    """
+    print("== Filled DOCX vs Completed reference documents ==")
+    failures = 0
+    ocr_failures = 0
+    for claim in claims:
+        name, folder, template, pdfs = claim
+        values = expected.get(name)
+        if not values:
+            print(f"  {name}: no reference values found, skipped")
+            continue
+        _, filled, metrics, warnings = run_claim(claim, options)
+        ours = placeholder_values(docx_text(template), docx_text(io.BytesIO(filled)))
+        wrong = [f"{key}: expected {value!r}, got {ours.get(key)!r}"
+                 for key, value in sorted(values.items()) if not _same(ours.get(key, ""), value)]
+        score = 1 - len(wrong) / len(values)
+        ok = score >= options.min_score
+        failures += 0 if ok else 1
+        print(f"  {name}: {'ok  ' if ok else 'FAIL'} {len(values) - len(wrong)}/{len(values)} reference values "
+              f"filled correctly ({os.path.basename(find_reference(folder))})")
+        for line in wrong:
+            print(f"    {line}")
+        ocr_failures += report_ocr_failures(metrics, warnings)
+    print(f"  (min score {options.min_score})")
+    return failures, ocr_failures
+
+
+# --- Throughput ---
+def percentile(values, fraction):
+    # Nearest-rank percentile
+    return sorted(values)[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def measure_stages(claims, options):
+    """
+    Serial run for per-stage latency, LLM usage and peak traced memory.
+    """
+    runs = []
+    tracemalloc.start()
+    for _ in range(options.repeat):
+        for claim in claims:
+            runs.append(run_claim(claim, options)[2:])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return runs, peak
+
+
+def measure_throughput(claims, options, workers):
+    jobs = claims * options.repeat
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda claim: run_claim(claim, options), jobs))
+    return len(jobs) / (time.perf_counter() - start)
+
+
+def max_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def run_benchmark(claims, options):
+    """
+    Prints the latency and throughput report. Returns the number of pages that failed to OCR.
+    """
+    print(f"== Throughput (mock LLM latency {options.latency:g}s) ==")
+    runs, peak = measure_stages(claims, options)
+    ocr_failures = sum(report_ocr_failures(m, warnings) for m, warnings in runs[:len(claims)])
+    runs = [m for m, _ in runs]
+    for stage in STAGES:
+        # OCR timings of runs where pages failed measure the failure, not Tesseract
+        values = [m.timings[stage] for m in runs if stage in m.timings
+                  and not (stage == "ocr" and m.counters.get("ocr_failures"))]
+        if values:
+            print(f"  {stage:<16} mean {statistics.mean(values) * 1000:9.2f} ms   "
+                  f"p95 {percentile(values, 0.95) * 1000:9.2f} ms   ({len(values)} runs)")
+    totals = Counter()
+    for m in runs:
+        totals.update(m.counters)
+    print(f"  per claim: {totals['pages'] / len(runs):.1f} pages ({totals['ocr_pages'] / len(runs):.1f} OCR'd, "
+          f"{totals['ocr_failures'] / len(runs):.1f} failed), "
+          f"{totals['llm_requests'] / len(runs):.1f} LLM requests, "
+          f"{totals['prompt_tokens'] / len(runs):,.0f} prompt + {totals['completion_tokens'] / len(runs):,.0f} completion tokens, "
+          f"{totals['fields_from_rules'] / len(runs):.1f}/{totals['fields_requested'] / len(runs):.1f} fields from rules")
+    print(f"  peak traced memory {peak / (1024 * 1024):.1f} MB")
+    for workers in options.workers:
+        rate = measure_throughput(claims, options, workers)
+        print(f"  workers={workers:<3} {rate:8.2f} claims/s")
+    rss = max_rss_mb()
+    if rss is not None:
+        print(f"max RSS {rss:.1f} MB")
+    return ocr_failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the GLR pipeline on the bundled examples with a mock LLM.")
+    parser.add_argument("--examples-dir", default=EXAMPLES_DIR)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Claims processed concurrently.")
+    parser.add_argument("--repeat", type=int, default=1, help="Times to run over the claim set per measurement.")
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds the mock LLM waits before each reply.")
+    parser.add_argument("--fail-first", type=int, default=0, help="Mock LLM fails the first N requests (exercises retries).")
+    parser.add_argument("--dpi", type=int, default=OCR_DPI)
+    parser.add_argument("--max-chunk-tokens", type=int, default=MAX_CHUNK_TOKENS)
+    parser.add_argument("--use-cache", action="store_true", help="Use the OCR and LLM caches (off, to time the real work).")
+    parser.add_argument("--no-prefilter", action="store_true")
+    parser.add_argument("--no-rules", action="store_true")
+    parser.add_argument("--min-score", type=float, default=0.9, help="Minimum share of reference values filled correctly.")
+    parser.add_argument("--skip-regression", action="store_true")
+    parser.add_argument("--skip-throughput", action="store_true")
+    parser.add_argument("--allow-ocr-failures", action="store_true",
+                        help="Don't fail the run when pages can't be OCR'd (e.g. Tesseract not installed).")
+    args = parser.parse_args(argv)
+
+    claims, problems = discover_claims(args.examples_dir, (REFERENCE_PATTERN,))
+    for name, error in problems:
+        print(f"[{name}] skipped: {error}")
+    if not claims:
+        print(f"No claims found in {args.examples_dir}")
+        return 1
+    expected = {}
+    for name, folder, template, pdfs in claims:
+        reference = find_reference(folder)
+        if reference:
+            expected[name] = placeholder_values(docx_text(template), document_text(reference))
+    print(f"{len(claims)} claims from {args.examples_dir}")
+
+    # No rate limit and quick retries: the benchmark measures the pipeline, not the API budget
+    set_client(OpenRouterClient(requests_per_minute=0, backoff_base=0.05, backoff_max=0.5))
+    failures = 0
+    ocr_failures = 0
+    with MockOpenRouter(latency=args.latency, reply=make_reply(claims, expected), fail_first=args.fail_first) as server:
+        llm_utils.OPENROUTER_URL = server.url
+        if not args.skip_regression:
+            failures, ocr_failures = check_references(claims, expected, args)
+        if not args.skip_throughput:
+            ocr_failures += run_benchmark(claims, args)
+        print(f"mock LLM served {server.requests} requests ({server.failures} failed on purpose)")
+    if ocr_failures and not args.allow_ocr_failures:
+        print("Some pages failed to OCR (see above), so OCR results and timings are incomplete. "
+              "Install Tesseract or pass --allow-ocr-failures.")
+        return 1
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+# Root folder for the pipeline's on-disk caches; override with GLR_CACHE_DIR
+CACHE_ROOT = os.environ.get("GLR_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "glr-pipeline"))
+
+
+def make_key(*parts):
+    """
+    Builds a SHA-256 hex key from str/bytes/number parts.
+    Each part is length-prefixed so ("ab", "c") and ("a", "bc") don't collide.
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, bytes):
+            part = str(part).encode("utf-8")
+        h.update(len(part).to_bytes(8, "little"))
+        h.update(part)
+    return h.hexdigest()
+
+
+class CacheStats:
+    """
+    Hit/miss counters for a DiskCache. bytes_saved is whatever the caller reports
+    per hit (e.g. the size of the page image that didn't have to be OCR'd).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def record(self, hit, saved_bytes=0):
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self.bytes_saved += saved_bytes
+            else:
+                self.misses += 1
+
+    def copy(self):
+        snapshot = CacheStats()
+        with self._lock:
+            snapshot.hits, snapshot.misses, snapshot.bytes_saved = self.hits, self.misses, self.bytes_saved
+        return snapshot
+
+    def __sub__(self, earlier):
+        """
+        Counters accumulated since an earlier copy(), e.g. for a single run.
+        """
+        delta = CacheStats()
+        delta.hits = self.hits - earlier.hits
+        delta.misses = self.misses - earlier.misses
+        delta.bytes_saved = self.bytes_saved - earlier.bytes_saved
+        return delta
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+            "bytes_saved": self.bytes_saved,
+        }
+
+
+class DiskCache:
+    """
+    Small JSON-on-disk key/value cache with size-bounded LRU eviction and an optional TTL.
+    One file per entry; a file's mtime is its last-used time and the write time is stored inside.
+    Safe to share between threads and processes (writes are atomic renames).
+    """
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, ttl=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl  # seconds, or None to keep entries until evicted
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._size = None  # lazily computed total size of the cache folder
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key, default=None, saved_bytes=0, record=True):
+        """
+        Returns the cached value for key (or default), recording a hit or miss unless
+        record is False (the caller then records the outcome itself via stats.record).
+        """
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            created, value = entry["created"], entry["value"]
+        except (OSError, ValueError, KeyError, TypeError):
+            if record:
+                self.stats.record(False)
+            return default
+        if self.ttl is not None and time.time() - created > self.ttl:
+            self.delete(key)
+            if record:
+                self.stats.record(False)
+            return default
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        if record:
+            self.stats.record(True, saved_bytes)
+        return value
+
+    def set(self, key, value):
+        path = self._path(key)
+        data = json.dumps({"created": time.time(), "value": value}, ensure_ascii=False).encode("utf-8")
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: could not write cache entry {path}: {e}")
+            return
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _entries(self):
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for sub in os.listdir(self.directory):
+            sub_path = os.path.join(self.directory, sub)
+            if not os.path.isdir(sub_path):
+                continue
+            for name in os.listdir(sub_path):
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(sub_path, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        # Rescan so entries written by other processes are counted, then drop least recently used
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._size = total
+
+    def clear(self):
+        with self._lock:
+            for _, _, path in self._entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._size = 0
+
+    def size_bytes(self):
+        return self._scan_size()
+
+
+def format_stats(name, stats):
+    """
+    One-line human readable summary, e.g. for st.caption.
+    """
+    total = stats.hits + stats.misses
+    return (f"{name}: {stats.hits}/{total} hits ({stats.hit_rate:.0%}), "
+            f"{stats.bytes_saved / (1024 * 1024):.1f} MB not reprocessed")
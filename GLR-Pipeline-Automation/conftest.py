@@ -0,0 +1,6 @@
+import os
+import tempfile
+
+# Keep the OCR/LLM disk caches of test runs out of the user's cache folder.
+# Set before any test module imports pdf_utils/llm_utils, which read it at import time.
+os.environ["GLR_CACHE_DIR"] = tempfile.mkdtemp(prefix="glr-test-cache-")
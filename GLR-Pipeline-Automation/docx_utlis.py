@@ -1,5 +1,12 @@
-from docx import Document
+import copy
+import hashlib
+import io
 import re
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from lxml import etree
 
 # Mapping from template placeholders to LLM keys
 TEMPLATE_TO_LLM_KEY = {
@@ -15,60 +22,207 @@ TEMPLATE_TO_LLM_KEY = {
     # 'TEMPLATE_KEY': 'LLM Key',
 }
 
-def fill_docx_template(template_file, key_value_pairs, output_path):
+# Placeholders in the form {{FieldName}} or [FieldName]
+PLACEHOLDER_PATTERN = re.compile(r'\{\{(.*?)\}\}|\[(.*?)\]')
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+W_P = f"{{{W_NS}}}p"
+W_T = f"{{{W_NS}}}t"
+XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+# Package parts that can hold placeholder text (body incl. nested tables/text boxes, headers, footers, notes)
+TEXT_PARTS = re.compile(r'^word/(document|header\d*|footer\d*|footnotes|endnotes)\.xml$')
+
+
+def _read_bytes(template_file):
+    if isinstance(template_file, (bytes, bytearray)):
+        return bytes(template_file)
+    if hasattr(template_file, "read"):
+        template_file.seek(0)
+        return template_file.read()
+    with open(template_file, "rb") as f:
+        return f.read()
+
+
+def _lookup(key, key_map):
+    """
+    Value for a placeholder: TEMPLATE_TO_LLM_KEY mapping first, then a direct
+    case-insensitive match. Returns None if neither is present.
+    """
+    value = None
+    mapped_key = TEMPLATE_TO_LLM_KEY.get(key.upper())
+    if mapped_key:
+        value = key_map.get(mapped_key.lower())
+    if value is None:
+        value = key_map.get(key.lower())
+    return value
+
+
+def missing_placeholders(keys, key_value_pairs):
+    """
+    Placeholders (or field names) in keys that key_value_pairs has no value for,
+    using the same lookup as DocxTemplate.fill. Order is preserved.
+    """
+    key_map = {str(k).lower(): v for k, v in key_value_pairs.items()}
+    return [key for key in keys if _lookup(key, key_map) is None]
+
+
+class DocxTemplate:
+    """
+    A DOCX template parsed once for repeated filling.
+    Every placeholder in the body (including nested tables and text boxes), headers,
+    footers and foot/endnotes is indexed by paragraph, so placeholders that Word split
+    across several runs are found too. fill() then only copies the indexed XML parts,
+    substitutes values and zips the package into an in-memory buffer.
+    """
+    def __init__(self, template_file):
+        data = _read_bytes(template_file)
+        self._members = []  # (ZipInfo, raw bytes), raw is None for parts rebuilt on fill
+        self._parts = {}  # part name -> (parsed XML root, placeholder occurrences)
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            for info in zf.infolist():
+                raw = zf.read(info)
+                if TEXT_PARTS.match(info.filename):
+                    root = etree.fromstring(raw)
+                    occurrences = self._index(root)
+                    if occurrences:
+                        self._parts[info.filename] = (root, occurrences)
+                        raw = None
+                self._members.append((info, raw))
+        self.placeholders = sorted({key for _, occurrences in self._parts.values() for key, _ in occurrences})
+
+    @staticmethod
+    def _index(root):
+        """
+        Returns [(key, [(text_index, start, end), ...]), ...] in document order, where
+        text_index is the position of a w:t element in root.iter(W_T) and start/end
+        the slice of its text covered by the placeholder.
+        """
+        texts = list(root.iter(W_T))
+        paragraphs = OrderedDict()  # innermost w:p -> indices of its w:t elements
+        for i, t in enumerate(texts):
+            p = t.getparent()
+            while p is not None and p.tag != W_P:
+                p = p.getparent()
+            paragraphs.setdefault(p, []).append(i)
+        occurrences = []
+        for indices in paragraphs.values():
+            full = "".join(texts[i].text or "" for i in indices)
+            if "{{" not in full and "[" not in full:
+                continue
+            bounds = []
+            pos = 0
+            for i in indices:
+                length = len(texts[i].text or "")
+                bounds.append((i, pos, pos + length))
+                pos += length
+            for match in PLACEHOLDER_PATTERN.finditer(full):
+                key = (match.group(1) if match.group(1) is not None else match.group(2)).strip()
+                if len(key) < 2:
+                    continue  # checkboxes ("[ ]", "[X]") and empty brackets are not placeholders
+                segments = [(i, max(match.start(), s) - s, min(match.end(), e) - s)
+                            for i, s, e in bounds if s < match.end() and e > match.start()]
+                occurrences.append((key, segments))
+        return occurrences
+
+    @staticmethod
+    def _render(root, occurrences, key_map, missing):
+        root = copy.deepcopy(root)
+        texts = list(root.iter(W_T))
+        # Right to left, so earlier offsets inside the same w:t stay valid
+        for key, segments in reversed(occurrences):
+            value = _lookup(key, key_map)
+            if value is None:
+                missing.add(key)
+                continue
+            # The value goes in the first run; the rest of a split placeholder is removed
+            for n, (i, start, end) in enumerate(segments):
+                t = texts[i]
+                text = t.text or ""
+                t.text = text[:start] + (str(value) if n == 0 else "") + text[end:]
+                t.set(XML_SPACE, "preserve")
+        return etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True)
+
+    def fill(self, key_value_pairs, metrics=None):
+        """
+        Returns (buffer, missing): a BytesIO with the filled DOCX and the set of
+        placeholders that had no value in key_value_pairs (left unchanged).
+        metrics (metrics_utils.PipelineMetrics) records the "fill" time and
+        filled/missing placeholder counts.
+        """
+        start = time.perf_counter()
+        key_map = {str(k).lower(): v for k, v in key_value_pairs.items()}
+        missing = set()
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+            for info, raw in self._members:
+                if raw is None:
+                    root, occurrences = self._parts[info.filename]
+                    raw = self._render(root, occurrences, key_map, missing)
+                zf.writestr(info, raw)
+        buffer.seek(0)
+        if metrics is not None:
+            metrics.add_time("fill", time.perf_counter() - start)
+            metrics.count("placeholders_filled", len(set(self.placeholders) - missing))
+            metrics.count("placeholders_missing", len(missing))
+        return buffer, missing
+
+
+_template_cache = OrderedDict()
+_template_cache_lock = threading.Lock()
+TEMPLATE_CACHE_SIZE = 16
+
+
+def compile_template(template_file, metrics=None):
+    """
+    Returns a DocxTemplate for a path, file-like object or bytes, reusing the
+    compiled template when the same file content was compiled before.
+    metrics records the "template_compile" time and template cache hits.
+    """
+    start = time.perf_counter()
+    data = _read_bytes(template_file)
+    key = hashlib.sha256(data).hexdigest()
+    with _template_cache_lock:
+        template = _template_cache.get(key)
+        if template is not None:
+            _template_cache.move_to_end(key)
+    if template is not None:
+        if metrics is not None:
+            metrics.count("template_cache_hits")
+            metrics.add_time("template_compile", time.perf_counter() - start)
+        return template
+    template = DocxTemplate(data)
+    if metrics is not None:
+        metrics.add_time("template_compile", time.perf_counter() - start)
+    with _template_cache_lock:
+        _template_cache[key] = template
+        while len(_template_cache) > TEMPLATE_CACHE_SIZE:
+            _template_cache.popitem(last=False)
+    return template
+
+
+def fill_docx_template(template_file, key_value_pairs, output_path, metrics=None):
     """
     Fills a DOCX template with key-value pairs and saves the result to output_path.
     Supports placeholders in the form {{FieldName}} or [FieldName], case-insensitive.
     Uses TEMPLATE_TO_LLM_KEY to map template keys to LLM keys.
     Warns if a placeholder is not found in the extracted data.
+    The compiled template is cached (compile_template), so repeated fills of the same
+    template only pay for substitution and saving.
+    metrics records template compile, fill and "save" times (see DocxTemplate.fill).
     """
     try:
-        doc = Document(template_file)
-        # Build a case-insensitive key map
-        key_map = {k.lower(): v for k, v in key_value_pairs.items()}
-        # Patterns for both {{KEY}} and [KEY]
-        patterns = [re.compile(r'\{\{(.*?)\}\}'), re.compile(r'\[(.*?)\]')]
-        warnings = set()
-        def replace_placeholders(text):
-            for pattern in patterns:
-                matches = pattern.findall(text)
-                for match in matches:
-                    key = match.strip()
-                    # Try mapping first
-                    mapped_key = TEMPLATE_TO_LLM_KEY.get(key.upper())
-                    value = None
-                    if mapped_key:
-                        value = key_map.get(mapped_key.lower())
-                    if value is None:
-                        # Fallback to direct match
-                        value = key_map.get(key.lower())
-                    if value is not None:
-                        text = text.replace(f"{{{{{key}}}}}", str(value))
-                        text = text.replace(f"[{key}]", str(value))
-                    else:
-                        warnings.add(key)
-            return text
-        # Replace in paragraphs
-        for para in doc.paragraphs:
-            inline = para.runs
-            for i in range(len(inline)):
-                text = inline[i].text
-                new_text = replace_placeholders(text)
-                inline[i].text = new_text
-        # Replace in tables
-        for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    for para in cell.paragraphs:
-                        inline = para.runs
-                        for i in range(len(inline)):
-                            text = inline[i].text
-                            new_text = replace_placeholders(text)
-                            inline[i].text = new_text
-        doc.save(output_path)
+        buffer, warnings = compile_template(template_file, metrics).fill(key_value_pairs, metrics)
+        start = time.perf_counter()
+        if hasattr(output_path, "write"):
+            output_path.write(buffer.getvalue())
+        else:
+            with open(output_path, "wb") as f:
+                f.write(buffer.getvalue())
+        if metrics is not None:
+            metrics.add_time("save", time.perf_counter() - start)
         if warnings:
             print(f"Warning: The following placeholders were not found in the extracted data: {sorted(warnings)}")
         return True
     except Exception as e:
         print(f"Error filling DOCX template: {e}")
-        return False 
\ No newline at end of file
+        return False
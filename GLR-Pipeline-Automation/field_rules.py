@@ -0,0 +1,195 @@
+import re
+
+# Minimum confidence for a rule-based value to be used without asking the LLM
+MIN_CONFIDENCE = 0.8
+# Confidence of a value found next to its label, and of one cut out of text runs glued together
+LABEL_CONFIDENCE = 0.95
+GLUED_CONFIDENCE = 0.6
+
+MONTHS = r"(?:Jan(?:uary)?|Feb(?:ruary)?|Mar(?:ch)?|Apr(?:il)?|May|June?|July?|Aug(?:ust)?|Sep(?:t(?:ember)?)?|Oct(?:ober)?|Nov(?:ember)?|Dec(?:ember)?)"
+DATE = re.compile(r"\b(?:\d{1,2}[/-]\d{1,2}[/-](?:\d{4}|\d{2})(?!\d)|" + MONTHS + r"\.?\s+\d{1,2},?\s+\d{4})")
+PHONE = re.compile(r"(?<!\d)(?:\(\d{3}\)\s?|\d{3}[ .-])\d{3}[ .-]\d{4}(?!\d)")
+CITY_STATE_ZIP = re.compile(r"(?P<city>[A-Za-z][A-Za-z .'-]*?),?\s+(?P<state>[A-Z]{2})\s*,?\s+(?P<zip>\d{5}(?:\s*-\s*\d{4})?)\b")
+STREET_SUFFIX = r"(?i:St|Street|Ave|Avenue|Rd|Road|Dr|Drive|Ln|Lane|Blvd|Ct|Court|Way|Pl|Place|Hwy|Pkwy|Cir|Circle|Ter|Trl)"
+# Without a comma the street/city split is only trusted after a street suffix
+ADDRESS = re.compile(r"(?P<street>\d+\s+(?:[^,\n]+?(?=,)|[^,\n]*?\b" + STREET_SUFFIX + r"\b\.?))\s*,?\s+" + CITY_STATE_ZIP.pattern)
+ID_VALUE = re.compile(r"[A-Z0-9][A-Z0-9-]*\d[A-Z0-9-]*")
+NAME_VALUE = re.compile(r"[A-Z][A-Za-z.'&-]*(?:[ ][A-Z&][A-Za-z.'&-]*)+")
+STREET_LINE = re.compile(r"^(?:\d+\s+\S.*|P\.?\s*O\.?\s+BOX\s+\d+.*)$", re.I)
+COMPANY = re.compile(r"\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\s+(?:Solutions|Claims(?:\s+(?:Service|Services|Solutions))?|Adjusting|Adjusters|Services|Inc\.?|LLC)\b")
+CARRIER_SERVICE_PROVIDER = re.compile(r"\bAn?\s+([A-Z][A-Za-z&]*(?:\s+[A-Z][A-Za-z&]*)*)\s+Service\s+Provider\b")
+
+# (field, label pattern, value kind); the value is taken from the rest of the line, or the next line if that is empty
+LABEL_RULES = [
+    ("POLICY_NO", r"policy\s*(?:#|no\b\.?|number)\s*:?", "id"),
+    ("DATE_LOSS", r"(?:date\s+of\s+loss|loss\s+date|\bDOL)\s*:?", "date"),
+    ("DATE_INSPECTED", r"(?:date\s+)?inspect(?:ed|ion)(?:\s+date)?\s*:", "date"),
+    ("DATE_RECEIVED", r"(?:date\s+)?(?:received|assigned)(?:\s+date)?\s*:", "date"),
+    ("INSURED_NAME", r"insured(?:'s)?(?:\s+name)?\s*:", "name"),
+    ("CARRIER_NAME", r"(?:carrier|insurance\s+company|insurer)(?:\s+name)?\s*:", "text"),
+    ("MORTGAGEE", r"mortgagee\s*:", "text"),
+    ("MORTGAGE_CO", r"mortgage\s+(?:company|co\.?)\s*:", "text"),
+    ("TOL_CODE", r"(?:type|cause)\s+of\s+loss\s*:", "text"),
+    ("INSURED_H_STREET", r"(?:location\s+of\s+loss|loss\s+location|address\s+of\s+loss|risk\s+address|property\s+address|loss\s+address)\s*:", "address"),
+]
+LABEL_RULES = [(field, re.compile(label, re.I), kind) for field, label, kind in LABEL_RULES]
+
+# Lines at the top of each report searched for the service provider's letterhead
+LETTERHEAD_LINES = 15
+
+# Template placeholder spellings of the rule fields: Xactimate (XM8_) prefixes, property address for home address
+PLACEHOLDER_PREFIXES = ("XM8_",)
+PLACEHOLDER_RENAMES = {"INSURED_P_": "INSURED_H_"}
+
+
+def _clean(value):
+    return re.sub(r"\s+", " ", value).strip(" \t,;:-")
+
+
+def _first_segment(value):
+    # Columns in PDF text are usually separated by runs of spaces or tabs
+    return re.split(r"\t|\s{3,}", value.strip())[0]
+
+
+def _parse_value(kind, value):
+    """
+    Returns {field_suffix_or_None: (value, confidence)} for a labelled value, or {}
+    if it doesn't have the expected shape. Values are never cut short: a value that
+    only partly has the expected shape is left for the LLM.
+    """
+    if kind == "date":
+        match = DATE.search(value)
+        return {None: (match.group(0), LABEL_CONFIDENCE)} if match else {}
+    if kind == "id":
+        words = value.split()
+        word = words[0].rstrip(".,;:") if words else ""
+        if len(word) >= 5 and ID_VALUE.fullmatch(word):
+            return {None: (word, LABEL_CONFIDENCE)}
+        match = ID_VALUE.match(word)
+        # Text runs glued together ("95AAlacrity"): the last capital probably starts the
+        # next word, but that is a guess, so it is not trusted without the LLM
+        if match and match.group(0)[-1].isalpha() and word[match.end():match.end() + 1].islower():
+            token = match.group(0)[:-1]
+            return {None: (token, GLUED_CONFIDENCE)} if len(token) >= 5 else {}
+        return {}
+    if kind == "name":
+        name = _clean(_first_segment(value))
+        return {None: (name, LABEL_CONFIDENCE)} if len(name) <= 80 and NAME_VALUE.fullmatch(name) else {}
+    if kind == "text":
+        text = _clean(_first_segment(value))
+        if not text or len(text) > 80 or re.match(r"^[A-Za-z ]{1,30}:", text):
+            return {}
+        return {None: (text, LABEL_CONFIDENCE)}
+    if kind == "address":
+        match = ADDRESS.search(value)
+        if not match:
+            return {}
+        return {
+            "INSURED_H_STREET": (_clean(match.group("street")), LABEL_CONFIDENCE),
+            "INSURED_H_CITY": (_clean(match.group("city")), LABEL_CONFIDENCE),
+            "INSURED_H_STATE": (match.group("state"), LABEL_CONFIDENCE),
+            "INSURED_H_ZIP": (re.sub(r"\s+", "", match.group("zip")), LABEL_CONFIDENCE),
+        }
+    return {}
+
+
+def _label_candidates(lines):
+    for i, line in enumerate(lines):
+        for field, label, kind in LABEL_RULES:
+            for match in label.finditer(line):
+                rest = line[match.end():]
+                if not rest.strip() and i + 1 < len(lines):
+                    rest = lines[i + 1]
+                for target, (value, confidence) in _parse_value(kind, rest).items():
+                    yield target or field, value, confidence, f"label:{field}"
+
+
+def _letterhead_candidates(reports):
+    """
+    Service provider name, address and phone from a report's letterhead:
+    a company-like name followed within a few lines by an address and phone number.
+    """
+    for lines in reports:
+        head = [line for line in lines if line.strip()][:LETTERHEAD_LINES]
+        for i, line in enumerate(head):
+            company = COMPANY.search(line)
+            if not company:
+                continue
+            yield "SERVICE_PROVIDER", _clean(company.group(0)), 0.8, "letterhead"
+            address = []
+            for following in head[i + 1:i + 6]:
+                phone = PHONE.search(following)
+                if phone:
+                    yield "SERVICE_PROVIDER_PHONE", phone.group(0), 0.8, "letterhead"
+                    break
+                if STREET_LINE.match(following.strip()) or CITY_STATE_ZIP.search(following):
+                    address.append(_clean(following))
+            if address:
+                yield "SERVICE_PROVIDER_ADDRESS", ", ".join(address), 0.8, "letterhead"
+            break
+
+
+def extract_fields(text, min_confidence=MIN_CONFIDENCE):
+    """
+    Rule-based extraction of rigidly formatted GLR fields (policy number, dates,
+    insured name and address, carrier, service provider details, ...) from
+    extract_text_from_pdf output. Keys are REQUIRED_FIELDS names.
+    A field is only returned when its best candidates agree on one value with at
+    least min_confidence; conflicting values are left for the LLM.
+    Returns (pairs, details) where details[field] lists every candidate seen.
+    """
+    text = text.replace("\f", "\n")
+    lines = text.split("\n")
+    reports = [chunk.split("\n") for chunk in re.split(r"\n---\n", text)]
+
+    candidates = {}
+    for field, value, confidence, rule in _label_candidates(lines):
+        candidates.setdefault(field, []).append((value, confidence, rule))
+    for line in lines:
+        match = CARRIER_SERVICE_PROVIDER.search(line)
+        if match:
+            candidates.setdefault("CARRIER_NAME", []).append((match.group(1), 0.85, "service-provider-line"))
+    for field, value, confidence, rule in _letterhead_candidates(reports):
+        candidates.setdefault(field, []).append((value, confidence, rule))
+
+    pairs = {}
+    details = {}
+    for field, found in candidates.items():
+        best = max(confidence for _, confidence, _ in found)
+        top_values = {_clean(value).lower(): value for value, confidence, _ in found if confidence == best}
+        status = "ok"
+        if best < min_confidence:
+            status = "low confidence"
+        elif len(top_values) > 1:
+            status = "ambiguous"
+        else:
+            pairs[field] = next(iter(top_values.values()))
+        details[field] = {
+            "status": status,
+            "value": pairs.get(field),
+            "confidence": best,
+            "candidates": [{"value": v, "confidence": c, "rule": r} for v, c, r in found],
+        }
+    return pairs, details
+
+
+def rule_field(placeholder):
+    """
+    The extract_fields key a template placeholder corresponds to,
+    e.g. XM8_INSURED_P_ZIP -> INSURED_H_ZIP.
+    """
+    key = placeholder.strip().upper()
+    for prefix in PLACEHOLDER_PREFIXES:
+        if key.startswith(prefix):
+            key = key[len(prefix):]
+    for old, new in PLACEHOLDER_RENAMES.items():
+        if key.startswith(old):
+            key = new + key[len(old):]
+    return key
+
+
+def pairs_for_placeholders(pairs, placeholders):
+    """
+    Copies extract_fields values onto the template's own placeholder names.
+    """
+    return {key: pairs[rule_field(key)] for key in placeholders if rule_field(key) in pairs}
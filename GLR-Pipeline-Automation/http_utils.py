@@ -0,0 +1,164 @@
+import email.utils
+import os
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+# Status codes worth retrying: rate limited, or a transient server/gateway error
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+DEFAULT_REQUESTS_PER_MINUTE = int(os.environ.get("GLR_LLM_RPM", "60"))
+
+
+class RateLimiter:
+    """
+    Thread-safe limiter spacing calls 60/requests_per_minute seconds apart, so no
+    60 s window holds more than requests_per_minute calls. acquire() blocks until
+    the caller's slot comes up and returns the time spent waiting (0 disables spacing).
+    defer() holds every caller back for a while, e.g. when the server sends Retry-After.
+    """
+    def __init__(self, requests_per_minute, clock=time.monotonic, sleep=time.sleep):
+        self.requests_per_minute = requests_per_minute
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def acquire(self):
+        # Reserve the next slot under the lock, then sleep outside it so other threads can queue up
+        with self._lock:
+            now = self._clock()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        wait = slot - now
+        if wait > 0:
+            self._sleep(wait)
+        return max(wait, 0.0)
+
+    def defer(self, seconds):
+        with self._lock:
+            self._next_slot = max(self._next_slot, self._clock() + seconds)
+
+
+def parse_retry_after(value):
+    """
+    Parses a Retry-After header (delta-seconds or HTTP date) into seconds, or None.
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(when.timestamp() - time.time(), 0.0)
+
+
+class OpenRouterClient:
+    """
+    HTTP client for OpenRouter-compatible chat completion endpoints.
+    - Reuses pooled keep-alive connections (one requests.Session per client).
+    - Retries timeouts, connection errors and RETRYABLE_STATUS responses with
+      jittered exponential backoff. When the server sends Retry-After, the full delay
+      is waited and every thread sharing the RateLimiter holds off too; a Retry-After
+      longer than max_retry_after seconds fails the request instead.
+    - Spaces requests with a RateLimiter shared by every thread using the client.
+    stats counts requests, retries and time spent waiting for the rate limiter.
+    """
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, max_retries=4, backoff_base=1.0,
+                 backoff_max=30.0, max_retry_after=120.0, timeout=60, pool_size=16, clock=time.monotonic,
+                 sleep=time.sleep):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retry_after = max_retry_after
+        self.timeout = timeout
+        self.rate_limiter = RateLimiter(requests_per_minute, clock=clock, sleep=sleep)
+        self._sleep = sleep
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "retries": 0, "rate_limit_wait": 0.0}
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """
+        Delay before retry number `attempt` (0-based): Retry-After if given,
+        otherwise "full jitter" exponential backoff capped at backoff_max.
+        """
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def post_json(self, url, payload, headers=None):
+        """
+        POSTs payload as JSON and returns the decoded JSON response.
+        Returns (response_json, retries_used). Raises the last error once retries are exhausted,
+        or immediately for non-retryable errors (e.g. 401 bad API key); the raised exception
+        carries the retries made before giving up as its `retries` attribute.
+        """
+        attempt = 0
+        while True:
+            self._count("rate_limit_wait", self.rate_limiter.acquire())
+            self._count("requests")
+            try:
+                response = self.session.post(url, json=payload, headers=headers, timeout=self.timeout)
+                response.raise_for_status()
+                return response.json(), attempt
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                response = e.response
+                retryable = not isinstance(e, requests.HTTPError) or (response is not None and response.status_code in RETRYABLE_STATUS)
+                retry_after = parse_retry_after(response.headers.get("Retry-After")) if response is not None else None
+                if not retryable or attempt >= self.max_retries or (retry_after or 0) > self.max_retry_after:
+                    e.retries = attempt
+                    raise
+                delay = self.backoff_delay(attempt, retry_after)
+                if retry_after is not None:
+                    # The server is throttling the API key, not just this request
+                    self.rate_limiter.defer(delay)
+                self._sleep(delay)
+                attempt += 1
+                self._count("retries")
+
+    def chat_completion(self, url, api_key, payload):
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        return self.post_json(url, payload, headers=headers)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Returns the process-wide client, so all concurrent claims share one connection
+    pool and one requests-per-minute budget.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OpenRouterClient()
+        return _client
+
+
+def set_client(client):
+    """
+    Replaces the process-wide client (e.g. with a different rate limit).
+    """
+    global _client
+    with _client_lock:
+        _client = client
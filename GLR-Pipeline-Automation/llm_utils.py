@@ -1,19 +1,49 @@
-import requests
 import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from cache_utils import CACHE_ROOT, DiskCache, make_key
+from docx_utlis import missing_placeholders
+from field_rules import extract_fields, pairs_for_placeholders, MIN_CONFIDENCE
+from http_utils import get_client
 
-def format_prompt(text):
+# Override with GLR_OPENROUTER_URL to point at a local stand-in server (see mock_openrouter.py)
+OPENROUTER_URL = os.environ.get("GLR_OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+
+# Parsed LLM replies keyed by prompt, model and generation parameters
+llm_cache = DiskCache(
+    os.path.join(CACHE_ROOT, "llm"),
+    max_bytes=int(os.environ.get("GLR_LLM_CACHE_MB", "50")) * 1024 * 1024,
+    ttl=float(os.environ.get("GLR_LLM_CACHE_TTL_HOURS", "168")) * 3600,
+)
+
+# Raw responses starting with this mean at least one request failed (see is_api_error)
+API_ERROR_PREFIX = "API Error"
+
+REQUIRED_FIELDS = [
+    # Original and recent warning fields
+    "DATE_INSPECTED", "DATE_RECEIVED", "INSURED_H_CITY", "INSURED_H_STATE", "INSURED_H_ZIP", "MORTGAGEE", "MORTGAGE_CO", "TOL_CODE",
+    "DATE_LOSS", "INSURED_NAME", "INSURED_H_STREET", "CARRIER_NAME", "POLICY_NO", "SERVICE_PROVIDER", "SERVICE_PROVIDER_ADDRESS", "SERVICE_PROVIDER_PHONE",
+
+    # Add any other fields you want to always extract
+]
+
+def format_prompt(text, fields=None):
     """
-    Formats the prompt for the LLM to extract a fixed set of key-value pairs from the insurance report text.
-    Always returns all required keys, with empty string if missing.
+    Formats the prompt for the LLM to extract key-value pairs from the insurance report text.
+    With fields, the LLM is asked for exactly those keys, with empty string if missing;
+    otherwise for all relevant key-value pairs.
     """
-    required_fields = [
-        # Original and recent warning fields
-        "DATE_INSPECTED", "DATE_RECEIVED", "INSURED_H_CITY", "INSURED_H_STATE", "INSURED_H_ZIP", "MORTGAGEE", "MORTGAGE_CO", "TOL_CODE",
-        "DATE_LOSS", "INSURED_NAME", "INSURED_H_STREET", "CARRIER_NAME", "POLICY_NO", "SERVICE_PROVIDER", "SERVICE_PROVIDER_ADDRESS", "SERVICE_PROVIDER_PHONE",
-    
-        # Add any other fields you want to always extract
-    ]
-    fields_str = ", ".join(required_fields)
+    if fields:
+        fields_str = ", ".join(fields)
+        return (
+            "You are an expert insurance claims assistant. "
+            f"Extract the following fields from the insurance report text below: {fields_str}. "
+            "Return ONLY a valid JSON object with exactly these keys, with no extra text or explanation. "
+            "Use an empty string for any field you cannot find.\n\n"
+            f"Report Text:\n{text}\n\nKey-Value Pairs (JSON):"
+        )
     return (
         "You are an expert insurance claims assistant. "
         "Extract all relevant key-value pairs from the following insurance report text. "
@@ -23,17 +53,60 @@ def format_prompt(text):
     )
 
 
-def extract_key_value_pairs(text, api_key, model="openai/gpt-3.5-turbo"):
+def is_api_error(raw_response):
+    """
+    True if a raw response from the extractors reports a failed request, including
+    a failed chunk of a chunked extraction whose other chunks succeeded.
+    """
+    return raw_response.startswith(API_ERROR_PREFIX)
+
+
+def normalize_prompt(prompt):
+    """
+    Whitespace-insensitive form of a prompt used for cache keys, so re-extracted
+    text that differs only in line endings or spacing still hits the cache.
+    """
+    lines = (re.sub(r"[ \t]+", " ", line).strip() for line in prompt.replace("\r\n", "\n").split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+def parse_llm_reply(reply):
+    """
+    Parses the LLM reply as a JSON object, tolerating extra text around it.
+    Returns an empty dict if no JSON object can be found.
+    """
+    try:
+        key_value_pairs = json.loads(reply)
+    except json.JSONDecodeError:
+        # Try to extract JSON from the reply if extra text is present
+        match = re.search(r'\{.*\}', reply, re.DOTALL)
+        if match:
+            try:
+                key_value_pairs = json.loads(match.group(0))
+            except Exception as e:
+                print(f"Error parsing extracted JSON: {e}")
+                key_value_pairs = {}
+        else:
+            print("LLM response is not valid JSON.")
+            key_value_pairs = {}
+    if not isinstance(key_value_pairs, dict):
+        key_value_pairs = {}
+    return key_value_pairs
+
+
+def extract_key_value_pairs(text, api_key, model="openai/gpt-3.5-turbo", use_cache=True, fields=None, metrics=None):
     """
     Sends the extracted text to the LLM and returns structured key-value pairs as a dict.
+    With fields, only those keys are requested (see format_prompt).
     Handles API errors and invalid responses. Returns (key_value_pairs, raw_response).
+    Successful replies are cached (llm_cache); pass use_cache=False to force a fresh request.
+    Empty values are dropped; errors and replies without any non-empty value are never cached.
+    Requests go through the shared http_utils client (connection pooling, retries, rate limit).
+    metrics (metrics_utils.PipelineMetrics) records each request's tokens (from the
+    response's usage block), retries and latency, and cache hits.
     """
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    prompt = format_prompt(text)
+    url = OPENROUTER_URL
+    prompt = format_prompt(text, fields)
     data = {
         "model": model,
         "messages": [
@@ -42,29 +115,233 @@ def extract_key_value_pairs(text, api_key, model="openai/gpt-3.5-turbo"):
         "max_tokens": 1024,
         "temperature": 0.2
     }
+    cache_key = make_key("chat", url, model, data["max_tokens"], data["temperature"], normalize_prompt(prompt))
+    if use_cache:
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            if metrics is not None:
+                metrics.count("llm_cache_hits")
+            return cached["pairs"], cached["reply"]
+    start = time.perf_counter()
     try:
-        response = requests.post(url, headers=headers, data=json.dumps(data), timeout=60)
-        response.raise_for_status()
-        result = response.json()
+        # Pooled, rate-limited client that retries 429/5xx and network errors
+        result, retries = get_client().chat_completion(url, api_key, data)
         # Extract the LLM's reply
         reply = result["choices"][0]["message"]["content"]
-        # Try to parse the reply as JSON
-        try:
-            key_value_pairs = json.loads(reply)
-        except json.JSONDecodeError:
-            # Try to extract JSON from the reply if extra text is present
-            import re
-            match = re.search(r'\{.*\}', reply, re.DOTALL)
-            if match:
-                try:
-                    key_value_pairs = json.loads(match.group(0))
-                except Exception as e:
-                    print(f"Error parsing extracted JSON: {e}")
-                    key_value_pairs = {}
-            else:
-                print("LLM response is not valid JSON.")
-                key_value_pairs = {}
+        if metrics is not None:
+            _record_llm_call(metrics, model, prompt, start, retries, result.get("usage") or {})
+        # Empty values ("not found") are dropped so the placeholder stays visible and is reported as missing
+        key_value_pairs = {k: v for k, v in parse_llm_reply(reply).items() if v not in (None, "", [], {})}
+        if key_value_pairs:
+            llm_cache.set(cache_key, {"pairs": key_value_pairs, "reply": reply})
         return key_value_pairs, reply
     except Exception as e:
         print(f"Error communicating with LLM API: {e}")
-        return {}, f"API Error: {e}"
+        if metrics is not None:
+            _record_llm_call(metrics, model, prompt, start, getattr(e, "retries", None), {}, error=str(e))
+        return {}, f"{API_ERROR_PREFIX}: {e}"
+
+
+def _record_llm_call(metrics, model, prompt, start, retries, usage, error=None):
+    prompt_tokens = usage.get("prompt_tokens") or 0
+    completion_tokens = usage.get("completion_tokens") or 0
+    metrics.count("llm_requests")
+    metrics.count("llm_retries", retries or 0)
+    metrics.count("prompt_tokens", prompt_tokens)
+    metrics.count("completion_tokens", completion_tokens)
+    if error:
+        metrics.count("llm_errors")
+    metrics.record_llm_call(
+        model=model,
+        seconds=round(time.perf_counter() - start, 4),
+        retries=retries,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        prompt_tokens_estimated=estimate_tokens(prompt),
+        error=error,
+    )
+
+
+# --- Chunked (map-reduce) extraction for large reports ---
+# Rough token budget per chunk of report text; leaves room for the prompt and the reply
+MAX_CHUNK_TOKENS = 6000
+MAX_CONCURRENT_REQUESTS = 4
+MERGE_POLICIES = ("first", "majority", "longest")
+
+# app.py joins reports as "\n---\n<name>:\n<text>"; pdf_utils separates pages with "\f"
+REPORT_BOUNDARY = re.compile(r"(?=\n---\n)")
+PAGE_BOUNDARY = "\f"
+
+
+def estimate_tokens(text):
+    """
+    Cheap token estimate (~4 characters per token for English text).
+    """
+    return (len(text) + 3) // 4
+
+
+def _split_oversized(unit, max_tokens):
+    """
+    Splits a single page that is over budget at line boundaries, and a single
+    line that is over budget at character boundaries.
+    """
+    max_chars = max_tokens * 4
+    pieces, current = [], ""
+    for line in unit.splitlines(keepends=True):
+        while len(line) > max_chars:
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(line[:max_chars])
+            line = line[max_chars:]
+        if current and len(current) + len(line) > max_chars:
+            pieces.append(current)
+            current = ""
+        current += line
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_text(text, max_tokens=MAX_CHUNK_TOKENS):
+    """
+    Splits report text into chunks of at most ~max_tokens. Whole reports are kept
+    together when they fit; larger reports are broken at page boundaries, then
+    lines. Consecutive reports/pages are packed into the same chunk while they fit.
+    """
+    units = []  # (separator to use before the unit when packing, unit text)
+    for report in REPORT_BOUNDARY.split(text):
+        if not report.strip():
+            continue
+        if estimate_tokens(report) <= max_tokens:
+            units.append(("", report))
+            continue
+        for i, page in enumerate(report.split(PAGE_BOUNDARY)):
+            pieces = [page] if estimate_tokens(page) <= max_tokens else _split_oversized(page, max_tokens)
+            for j, piece in enumerate(pieces):
+                units.append((PAGE_BOUNDARY if i and not j else "", piece))
+    chunks = []
+    current = ""
+    for sep, unit in units:
+        candidate = f"{current}{sep}{unit}"
+        if current and estimate_tokens(candidate) > max_tokens:
+            chunks.append(current)
+            current = unit
+        else:
+            current = candidate
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+
+def merge_key_value_pairs(results, policy="first"):
+    """
+    Merges per-chunk dicts (in document order) into one. Keys are matched
+    case-insensitively and keys with only empty values are left out. Policies for conflicting values:
+    - "first": the value from the earliest chunk
+    - "majority": the most frequent value, ties going to the earliest
+    - "longest": the longest value (usually the most complete address/name)
+    Returns (merged, conflicts) where conflicts maps key -> all distinct values seen.
+    """
+    if policy not in MERGE_POLICIES:
+        raise ValueError(f"Unknown merge policy: {policy!r} (expected one of {MERGE_POLICIES})")
+    names = {}
+    values = {}
+    for pairs in results:
+        for key, value in pairs.items():
+            norm = str(key).strip().lower()
+            names.setdefault(norm, key)
+            values.setdefault(norm, [])
+            if value not in (None, "", [], {}):
+                values[norm].append(value)
+    merged = {}
+    conflicts = {}
+    for norm, seen in values.items():
+        key = names[norm]
+        if not seen:
+            continue
+        distinct = []
+        for value in seen:
+            if value not in distinct:
+                distinct.append(value)
+        if len(distinct) > 1:
+            conflicts[key] = distinct
+        if policy == "first":
+            merged[key] = distinct[0]
+        elif policy == "majority":
+            merged[key] = max(distinct, key=seen.count)
+        else:
+            merged[key] = max(distinct, key=lambda v: len(str(v)))
+    return merged, conflicts
+
+
+def extract_key_value_pairs_chunked(text, api_key, model="openai/gpt-3.5-turbo", max_chunk_tokens=MAX_CHUNK_TOKENS,
+                                    max_concurrency=MAX_CONCURRENT_REQUESTS, merge_policy="first", use_cache=True,
+                                    fields=None, metrics=None):
+    """
+    Map-reduce version of extract_key_value_pairs for text that doesn't fit one request.
+    The text is split with chunk_text, chunks are sent concurrently (at most
+    max_concurrency requests in flight) and the per-chunk dicts are merged with
+    merge_key_value_pairs. Text that fits in one chunk takes the single-request path.
+    Returns (key_value_pairs, raw_response) like extract_key_value_pairs; the raw
+    response lists each chunk's reply and any conflicting values. If any chunk's request
+    failed, the raw response starts with API_ERROR_PREFIX (is_api_error) even though the
+    pairs from the other chunks are returned, so callers can treat the result as incomplete.
+    """
+    chunks = chunk_text(text, max_chunk_tokens)
+    if len(chunks) <= 1:
+        return extract_key_value_pairs(text, api_key, model=model, use_cache=use_cache, fields=fields, metrics=metrics)
+    if metrics is not None:
+        metrics.count("llm_chunks", len(chunks))
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(chunks)))) as pool:
+        results = list(pool.map(
+            lambda chunk: extract_key_value_pairs(chunk, api_key, model=model, use_cache=use_cache, fields=fields,
+                                                  metrics=metrics), chunks))
+    merged, conflicts = merge_key_value_pairs([pairs for pairs, _ in results], merge_policy)
+    raw_parts = [f"--- Chunk {i + 1}/{len(chunks)} ---\n{reply}" for i, (_, reply) in enumerate(results)]
+    failed = [i + 1 for i, (_, reply) in enumerate(results) if is_api_error(reply)]
+    if failed:
+        raw_parts.insert(0, f"{API_ERROR_PREFIX}: {len(failed)} of {len(chunks)} chunks failed (chunk {', '.join(map(str, failed))})")
+    if conflicts:
+        raw_parts.append(f"--- Conflicting values (policy: {merge_policy}) ---\n{json.dumps(conflicts, indent=2)}")
+    return merged, "\n\n".join(raw_parts)
+
+
+# --- Rule-based pre-extraction ---
+RULES_ONLY_REPLY = "LLM call skipped: every field was found by the rule-based extractor."
+
+
+def extract_key_value_pairs_with_rules(text, api_key, fields=None, llm_text=None, use_rules=True,
+                                       min_confidence=MIN_CONFIDENCE, metrics=None, **llm_kwargs):
+    """
+    Fills what it can with field_rules.extract_fields (policy numbers, dates, names,
+    addresses, provider letterhead, ...) and asks the LLM only for the fields still missing.
+    - fields: the keys needed, e.g. the template's placeholders (default REQUIRED_FIELDS);
+      rule values are copied onto placeholder spellings such as XM8_INSURED_NAME
+    - llm_text: text to send to the LLM if different from text (e.g. prefilter_text output);
+      the rules always run on the full text
+    - use_rules=False sends every field to the LLM
+    - llm_kwargs: passed to extract_key_value_pairs_chunked
+    The LLM call is skipped when the rules cover every field. Rule values win over LLM values.
+    metrics records "rules" and "llm" stage times and how many fields each source filled.
+    Returns (key_value_pairs, raw_response, rule_details).
+    """
+    fields = list(fields or REQUIRED_FIELDS)
+    start = time.perf_counter()
+    rule_pairs, rule_details = extract_fields(text, min_confidence) if use_rules else ({}, {})
+    rule_pairs.update(pairs_for_placeholders(rule_pairs, fields))
+    missing = missing_placeholders(fields, rule_pairs)
+    if metrics is not None:
+        metrics.add_time("rules", time.perf_counter() - start)
+        metrics.count("fields_requested", len(fields))
+        metrics.count("fields_from_rules", len(fields) - len(missing))
+    if not missing:
+        return dict(rule_pairs), RULES_ONLY_REPLY, rule_details
+    start = time.perf_counter()
+    llm_pairs, raw = extract_key_value_pairs_chunked(llm_text if llm_text is not None else text, api_key,
+                                                     fields=missing, metrics=metrics, **llm_kwargs)
+    if metrics is not None:
+        metrics.add_time("llm", time.perf_counter() - start)
+    key_value_pairs = dict(llm_pairs)
+    key_value_pairs.update(rule_pairs)
+    return key_value_pairs, raw, rule_details
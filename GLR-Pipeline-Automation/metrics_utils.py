@@ -0,0 +1,94 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PipelineMetrics:
+    """
+    Timings and counters for one claim as it goes through the pipeline.
+    Passed as metrics= to extract_text_from_pdf, the llm_utils extractors and
+    the docx_utlis fill functions; all of them accept None to skip recording.
+    - timings: seconds per stage (summed when a stage runs more than once)
+    - counters: pages, ocr_pages, ocr_failures, page_cache_hits, llm_requests, llm_retries,
+      llm_cache_hits, prompt_tokens, completion_tokens, placeholders_filled, ...
+    - pages: one record per PDF page (file, page, method, cached, seconds, chars)
+    - llm_calls: one record per LLM request (tokens from the API's usage block, retries, seconds)
+    Safe to use from several threads (e.g. concurrent chunk requests).
+    """
+    def __init__(self, claim=None, **meta):
+        self.claim = claim
+        self.meta = meta
+        self.started = time.time()
+        self.timings = {}
+        self.counters = {}
+        self.pages = []
+        self.llm_calls = []
+        self._lock = threading.Lock()
+
+    def add_time(self, stage, seconds):
+        with self._lock:
+            self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_page(self, **record):
+        with self._lock:
+            self.pages.append(record)
+
+    def record_llm_call(self, **record):
+        with self._lock:
+            self.llm_calls.append(record)
+
+    def summary(self):
+        with self._lock:
+            return {
+                "claim": self.claim,
+                **self.meta,
+                "timestamp": round(self.started, 3),
+                "timings": {stage: round(seconds, 4) for stage, seconds in self.timings.items()},
+                "counters": dict(self.counters),
+            }
+
+    def as_dict(self):
+        record = self.summary()
+        with self._lock:
+            record["pages"] = list(self.pages)
+            record["llm_calls"] = list(self.llm_calls)
+        return record
+
+    def to_json_line(self):
+        return json.dumps(self.as_dict(), default=str)
+
+
+def append_jsonl(path, metrics):
+    """
+    Appends one JSON line per PipelineMetrics to path, so runs can be aggregated later.
+    """
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        for m in metrics:
+            f.write(m.to_json_line() + "\n")
+
+
+def format_metrics(metrics):
+    """
+    One-line summary, e.g. for a Streamlit caption.
+    """
+    c = metrics.counters
+    timings = ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in metrics.timings.items())
+    return (f"{timings} | {c.get('pages', 0)} pages ({c.get('ocr_pages', 0)} OCR'd) | "
+            f"{c.get('llm_requests', 0)} LLM requests, {c.get('llm_retries', 0)} retries, "
+            f"{c.get('prompt_tokens', 0):,} prompt + {c.get('completion_tokens', 0):,} completion tokens")
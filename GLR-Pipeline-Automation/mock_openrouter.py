@@ -0,0 +1,153 @@
+"""
+Local stand-in for the OpenRouter chat completions endpoint, for exercising the
+pipeline without network access or an API key.
+
+Run it and point the app at it:
+    python mock_openrouter.py --port 8765 --latency 0.5 --fail-first 2
+    GLR_OPENROUTER_URL=http://127.0.0.1:8765/api/v1/chat/completions streamlit run app.py
+
+Or use it in-process:
+    with MockOpenRouter(latency=0.2, fail_first=1) as server:
+        llm_utils.OPENROUTER_URL = server.url
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = {
+    "Insured's Name": "Jane Doe",
+    "Policy #": "POL-0000000",
+    "Date Taken": "01/01/2024",
+}
+
+
+class MockOpenRouter:
+    """
+    Threaded HTTP server answering POST /api/v1/chat/completions like OpenRouter.
+    - latency: seconds to wait before answering each request
+    - reply: dict (sent as JSON) or str returned as the assistant message; or a
+      callable taking the prompt and returning either
+    - fail_first: answer the first N requests with fail_status (429/503 etc.)
+    - retry_after: Retry-After header value sent with failures (None to omit)
+    Counters: requests, failures, and prompts (the prompts received, in order).
+    """
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, reply=None, fail_first=0, fail_status=429, retry_after="0"):
+        self.latency = latency
+        self.reply = DEFAULT_REPLY if reply is None else reply
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.retry_after = retry_after
+        self.requests = 0
+        self.failures = 0
+        self.prompts = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api/v1/chat/completions"
+
+    def _handler_class(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse is observable
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with mock._lock:
+                    mock.requests += 1
+                    fail = mock.failures < mock.fail_first
+                    if fail:
+                        mock.failures += 1
+                if mock.latency:
+                    time.sleep(mock.latency)
+                if fail:
+                    self._send(mock.fail_status, {"error": {"message": "mock failure", "code": mock.fail_status}},
+                               {"Retry-After": mock.retry_after} if mock.retry_after is not None else {})
+                    return
+                try:
+                    payload = json.loads(body)
+                    prompt = payload["messages"][-1]["content"]
+                except (ValueError, KeyError, IndexError):
+                    self._send(400, {"error": {"message": "invalid request body"}})
+                    return
+                with mock._lock:
+                    mock.prompts.append(prompt)
+                reply = mock.reply(prompt) if callable(mock.reply) else mock.reply
+                content = reply if isinstance(reply, str) else json.dumps(reply)
+                prompt_tokens = (len(prompt) + 3) // 4
+                completion_tokens = (len(content) + 3) // 4
+                self._send(200, {
+                    "id": f"mock-{mock.requests}",
+                    "model": payload.get("model", "mock"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                              "total_tokens": prompt_tokens + completion_tokens},
+                })
+
+            def _send(self, status, body, headers=None):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenRouter chat completions API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before each reply.")
+    parser.add_argument("--reply", help="JSON file with the key-value pairs to return.")
+    parser.add_argument("--fail-first", type=int, default=0, help="Fail the first N requests.")
+    parser.add_argument("--fail-status", type=int, default=429)
+    parser.add_argument("--retry-after", default="1", help="Retry-After header sent with failures.")
+    args = parser.parse_args()
+    reply = None
+    if args.reply:
+        with open(args.reply, "r", encoding="utf-8") as f:
+            reply = json.load(f)
+    server = MockOpenRouter(args.host, args.port, args.latency, reply, args.fail_first, args.fail_status, args.retry_after)
+    print(f"Mock OpenRouter listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,304 @@
 import PyPDF2
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
 import pytesseract
 import fitz  # PyMuPDF
 from PIL import Image
 import io
+import os
+import threading
+import time
+import functools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from cache_utils import CACHE_ROOT, DiskCache, make_key
 
+# Resolution used to render image-only pages before OCR
+OCR_DPI = 200
 
-def extract_text_from_pdf(file):
+# Rendered pages queued for OCR per pool worker; bounds memory for long image-only PDFs
+OCR_PAGES_PER_WORKER = 2
+
+# Inserted between pages so later stages (e.g. chunked LLM extraction) can split on page boundaries
+PAGE_BREAK = "\f"
+
+# Text-layer and OCR results keyed by page content, shared across runs
+ocr_cache = DiskCache(os.path.join(CACHE_ROOT, "ocr"), max_bytes=int(os.environ.get("GLR_OCR_CACHE_MB", "200")) * 1024 * 1024)
+
+_ocr_pool = None
+_ocr_pool_lock = threading.Lock()
+
+
+def _init_ocr_worker():
+    # Tesseract's own OpenMP threading fights with the process pool; one thread per worker.
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+
+def _new_ocr_pool(max_workers):
+    # Workers are started fresh rather than forked: forking a multithreaded server
+    # (Streamlit, the batch runner) can copy locks held by other threads.
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=context, initializer=_init_ocr_worker)
+
+
+def _get_ocr_pool():
+    """
+    Returns the process pool shared by all extract_text_from_pdf calls, creating it on first use.
+    """
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            _ocr_pool = _new_ocr_pool(os.cpu_count() or 1)
+        return _ocr_pool
+
+
+def _discard_ocr_pool(pool):
+    """
+    Drops a broken pool (a worker died), so the next extraction starts a new one.
+    """
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is pool:
+            _ocr_pool = None
+    pool.shutdown(wait=False)
+
+
+def _ocr_page(width, height, samples, tesseract_cmd):
+    """
+    Runs Tesseract on a rendered RGB page. Runs in a worker process, so the
+    Tesseract path configured in the parent is passed in explicitly.
+    Returns (text, seconds spent in Tesseract).
+    """
+    start = time.perf_counter()
+    try:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+        img = Image.frombytes("RGB", [width, height], samples)
+        return pytesseract.image_to_string(img), time.perf_counter() - start
+    except Exception as e:
+        # Some pytesseract errors (e.g. TesseractNotFoundError) can't be unpickled in the
+        # parent, which would break the whole pool; pass the message on instead.
+        raise RuntimeError(str(e)) from None
+
+
+@functools.lru_cache(maxsize=None)
+def _tesseract_version(tesseract_cmd):
+    try:
+        return str(pytesseract.get_tesseract_version())
+    except Exception:
+        return "unknown"
+
+
+def _hash_pdf_object(obj, parts, seen):
+    """
+    Appends a canonical serialization of obj and everything it references (resolving
+    indirect objects, including stream bytes) to parts. /Parent links are skipped so
+    the walk stays within the page. Each indirect object is expanded only once; later
+    references to it are recorded by visit order rather than object number, so the
+    hash depends on content, not on how the file numbers its objects.
+    """
+    if isinstance(obj, IndirectObject):
+        ref = (obj.idnum, obj.generation)
+        if ref in seen:
+            parts.append(f"back{seen[ref]}".encode())
+            return
+        seen[ref] = len(seen)
+        obj = obj.get_object()
+    if isinstance(obj, StreamObject):
+        # Raw (still encoded) bytes: cheap for images, and identical content gives identical bytes
+        data = obj._data if getattr(obj, "_data", None) is not None else obj.get_data()
+        parts.append(b"stream")
+        parts.append(data)
+    if isinstance(obj, DictionaryObject):
+        parts.append(b"<<")
+        for key in sorted(obj):
+            if key == "/Parent":
+                continue
+            parts.append(str(key).encode("utf-8"))
+            _hash_pdf_object(obj.raw_get(key), parts, seen)
+        parts.append(b">>")
+    elif isinstance(obj, ArrayObject):
+        parts.append(b"[")
+        for item in obj:
+            _hash_pdf_object(item, parts, seen)
+        parts.append(b"]")
+    elif not isinstance(obj, StreamObject):
+        parts.append(repr(obj).encode("utf-8"))
+
+
+def _page_fingerprint(page):
+    """
+    Hash of what determines a page's text layer: the page object with everything it
+    references - content streams (single or array), fonts (including ToUnicode maps)
+    and XObjects, recursing into Form XObjects and their own resources.
+    Returns (key, size_in_bytes), or (None, 0) if the page can't be fingerprinted,
+    in which case it is not cached.
+    """
+    try:
+        parts = []
+        _hash_pdf_object(page, parts, {})
+        size = sum(len(p) for p in parts)
+        return make_key("text-layer", PyPDF2.__version__, *parts), size
+    except Exception:
+        return None, 0
+
+
+def _render_page(doc, index, dpi):
+    pix = doc.load_page(index).get_pixmap(dpi=dpi, alpha=False)
+    return pix.width, pix.height, pix.samples
+
+
+def extract_text_from_pdf(file, dpi=OCR_DPI, max_workers=None, use_cache=True, metrics=None):
     """
     Extracts text from a PDF file-like object.
     - Uses PyPDF2 for text-based PDFs.
     - Uses OCR (pytesseract + PyMuPDF) for image-based (scanned/photo) PDFs.
-    Returns a tuple: (extracted_text, warnings_list)
+      The document is opened once; pages without a text layer are rendered at `dpi`
+      and OCR'd in a process pool. Pass max_workers=1 to OCR in-process. Each page is
+      rendered just before it is submitted, with at most OCR_PAGES_PER_WORKER pages
+      per worker waiting, so memory does not grow with the page count.
+    - Text-layer and OCR results are cached on disk (ocr_cache) per page content
+      (_page_fingerprint; OCR results also per dpi and Tesseract version), so unchanged
+      pages of a resubmitted report are not processed, or even rendered, again.
+      The cache stats count one lookup per page: its text layer, or its OCR result for
+      pages without one.
+    - metrics (metrics_utils.PipelineMetrics) records a timing record per page,
+      page/OCR/OCR-failure/cache-hit counts and text-layer vs OCR stage times.
+    Returns a tuple: (extracted_text, warnings_list); pages are separated by PAGE_BREAK.
     Requires Tesseract OCR to be installed on your system.
     """
-    text = ""
     warnings = []
+    file_name = os.path.basename(getattr(file, "name", "") or "") or None
+    pages = {}  # page index -> timing record, for metrics
+
+    def page_record(i, method, cached, seconds):
+        pages[i] = {"file": file_name, "page": i + 1, "method": method, "cached": cached, "seconds": round(seconds, 4)}
+
+    start = time.perf_counter()
     try:
-        reader = PyPDF2.PdfReader(file)
+        file.seek(0)
+        pdf_bytes = file.read()
+        reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
+        page_texts = []
+        ocr_indices = []
+        fingerprints = {}  # page index -> (key, size) for pages that need OCR
         for i, page in enumerate(reader.pages):
-            page_text = page.extract_text() or ""
+            page_start = time.perf_counter()
+            key, size = _page_fingerprint(page) if use_cache else (None, 0)
+            cached = ocr_cache.get(key, record=False) if key else None
+            if cached is not None:
+                page_text = cached["text"]
+            else:
+                page_text = page.extract_text() or ""
+                if key:
+                    ocr_cache.set(key, {"text": page_text})
+            page_record(i, "text", cached is not None, time.perf_counter() - page_start)
             if page_text.strip():
-                text += page_text
+                if key:
+                    ocr_cache.stats.record(cached is not None, size)
+                page_texts.append(page_text)
             else:
-                # OCR fallback for image-based page using PyMuPDF
-                try:
-                    file.seek(0)
-                    pdf_bytes = file.read()
-                    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-                    page_fitz = doc.load_page(i)
-                    pix = page_fitz.get_pixmap()
-                    img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                    ocr_text = pytesseract.image_to_string(img)
-                    if ocr_text.strip():
-                        text += ocr_text
-                    else:
-                        warnings.append(f"No text extracted from page {i+1} (OCR returned empty).")
-                except Exception as ocr_e:
-                    warnings.append(f"OCR failed on page {i+1}: {ocr_e}")
+                # Recorded once, by the OCR lookup below
+                fingerprints[i] = (key, size)
+                page_texts.append("")
+                ocr_indices.append(i)
     except Exception as e:
         warnings.append(f"Error extracting text from PDF: {e}")
         return "", warnings
+    if metrics is not None:
+        metrics.add_time("text_layer", time.perf_counter() - start)
+
+    ocr_start = time.perf_counter()
+    ocr_failures = 0
+    if ocr_indices:
+        page_warnings = {}
+        try:
+            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+        except Exception as e:
+            doc = None
+            for i in ocr_indices:
+                page_warnings[i] = f"OCR failed on page {i+1}: {e}"
+        if doc is not None:
+            tesseract_cmd = pytesseract.pytesseract.tesseract_cmd
+            if max_workers == 1 or len(ocr_indices) == 1:
+                pool = None
+            elif max_workers is None:
+                pool = _get_ocr_pool()
+            else:
+                pool = _new_ocr_pool(max_workers)
+            max_pending = OCR_PAGES_PER_WORKER * (max_workers or os.cpu_count() or 1)
+            pending = deque()
+            keys = {}
+            render_times = {}
+
+            def collect(i, future):
+                try:
+                    page_texts[i], ocr_seconds = future.result()
+                    page_record(i, "ocr", False, render_times[i] + ocr_seconds)
+                    if i in keys:
+                        ocr_cache.set(keys[i], {"text": page_texts[i]})
+                except BrokenProcessPool as ocr_e:
+                    _discard_ocr_pool(pool)
+                    page_warnings[i] = f"OCR failed on page {i+1}: {ocr_e}"
+                except Exception as ocr_e:
+                    page_warnings[i] = f"OCR failed on page {i+1}: {ocr_e}"
+
+            try:
+                for i in ocr_indices:
+                    while len(pending) >= max_pending:
+                        collect(*pending.popleft())
+                    try:
+                        render_start = time.perf_counter()
+                        page_key, size = fingerprints[i]
+                        if page_key:
+                            keys[i] = make_key("ocr", page_key, dpi, _tesseract_version(tesseract_cmd))
+                            cached = ocr_cache.get(keys[i], saved_bytes=size)
+                            if cached is not None:
+                                page_texts[i] = cached["text"]
+                                page_record(i, "ocr", True, time.perf_counter() - render_start)
+                                continue
+                        width, height, samples = _render_page(doc, i, dpi)
+                        render_times[i] = time.perf_counter() - render_start
+                        if pool is None:
+                            page_texts[i], ocr_seconds = _ocr_page(width, height, samples, tesseract_cmd)
+                            page_record(i, "ocr", False, render_times[i] + ocr_seconds)
+                            if i in keys:
+                                ocr_cache.set(keys[i], {"text": page_texts[i]})
+                        else:
+                            pending.append((i, pool.submit(_ocr_page, width, height, samples, tesseract_cmd)))
+                    except BrokenProcessPool as ocr_e:
+                        _discard_ocr_pool(pool)
+                        page_warnings[i] = f"OCR failed on page {i+1}: {ocr_e}"
+                    except Exception as ocr_e:
+                        page_warnings[i] = f"OCR failed on page {i+1}: {ocr_e}"
+                while pending:
+                    collect(*pending.popleft())
+            finally:
+                doc.close()
+                if pool is not None and max_workers is not None:
+                    pool.shutdown()
+        ocr_failures = len(page_warnings)
+        for i in ocr_indices:
+            if i in page_warnings:
+                warnings.append(page_warnings[i])
+            elif not page_texts[i].strip():
+                warnings.append(f"No text extracted from page {i+1} (OCR returned empty).")
+                page_texts[i] = ""
+
+    if metrics is not None:
+        if ocr_indices:
+            metrics.add_time("ocr", time.perf_counter() - ocr_start)
+        metrics.count("pdfs")
+        metrics.count("pages", len(page_texts))
+        metrics.count("ocr_pages", len(ocr_indices))
+        metrics.count("ocr_failures", ocr_failures)
+        metrics.count("page_cache_hits", sum(1 for record in pages.values() if record["cached"]))
+        for i in sorted(pages):
+            pages[i]["chars"] = len(page_texts[i].strip())
+            metrics.record_page(**pages[i])
+
+    text = PAGE_BREAK.join(t.strip() for t in page_texts if t.strip())
     if not text.strip():
         warnings.append("No text could be extracted from the entire PDF.")
     return text.strip(), warnings
@@ -0,0 +1,189 @@
+import functools
+import re
+from docx_utlis import TEMPLATE_TO_LLM_KEY
+from field_rules import PLACEHOLDER_PREFIXES, rule_field
+from llm_utils import estimate_tokens, PAGE_BOUNDARY, REQUIRED_FIELDS
+
+# Extra phrases that signal a field, beyond the words in the field and mapped key names
+FIELD_SYNONYMS = {
+    "DATE_LOSS": ["date of loss", "loss date", "dol", "date taken"],
+    "DATE_INSPECTED": ["inspected", "inspection", "date of inspection"],
+    "DATE_RECEIVED": ["received", "assigned", "assignment"],
+    "INSURED_NAME": ["insured", "member", "policyholder", "homeowner", "owner"],
+    "INSURED_H_STREET": ["address", "risk address", "property", "location"],
+    "INSURED_H_CITY": ["city"],
+    "INSURED_H_STATE": ["state"],
+    "INSURED_H_ZIP": ["zip", "postal"],
+    "CARRIER_NAME": ["carrier", "insurer", "insurance company", "underwriter"],
+    "POLICY_NO": ["policy", "policy #", "policy number", "claim #", "claim number"],
+    "MORTGAGEE": ["mortgagee", "mortgage", "lender", "lienholder"],
+    "MORTGAGE_CO": ["mortgage company", "mortgage co", "bank"],
+    "TOL_CODE": ["type of loss", "cause of loss", "peril", "wind", "hail", "storm", "water", "fire", "theft",
+                 "lightning", "freeze", "flood", "power outage", "collapse", "smoke"],
+    "SERVICE_PROVIDER": ["service provider", "provider", "adjuster", "contractor", "solutions", "claims service"],
+    "SERVICE_PROVIDER_ADDRESS": ["po box", "suite", "ste"],
+    "SERVICE_PROVIDER_PHONE": ["phone", "tel", "fax", "cell"],
+}
+
+# Spelled-out forms of abbreviations used in template placeholder names (XM8_COV_RCV_1, XM8_CLAIM_NUM, ...)
+WORD_SYNONYMS = {
+    "no": ["number", "#"],
+    "num": ["number", "#"],
+    "cov": ["coverage"],
+    "acv": ["actual cash value"],
+    "rcv": ["replacement cost"],
+    "lr": ["loss"],
+    "rep": ["representative", "adjuster"],
+    "tol": ["type of loss", "cause of loss"],
+    "desc": ["description"],
+    "mail": ["email", "e-mail"],
+}
+
+# Formats that usually carry a field value
+VALUE_PATTERNS = [
+    re.compile(r"\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b"),                               # dates
+    re.compile(r"\b(?:\+?1[ .-]?)?\(?\d{3}\)?[ .-]?\d{3}[ .-]\d{4}\b"),              # phone numbers
+    re.compile(r"\b[A-Z]{2}\s+\d{5}(?:-\d{4})?\b"),                                  # state + ZIP
+    re.compile(r"\b\d+\s+[A-Za-z0-9 .]+\b(?:st|street|ave|avenue|rd|road|dr|drive|ln|lane|blvd|ct|court|way|pl|hwy)\b\.?", re.I),
+    re.compile(r"[\w.+-]+@[\w-]+\.[\w.]+"),                                          # emails
+    re.compile(r"#\s*:?\s*[A-Z0-9][A-Z0-9-]{4,}"),                                   # "#: 0146..." style numbers
+]
+LABEL_PATTERN = re.compile(r"^[A-Za-z][A-Za-z '#./&()-]{1,40}:\s*\S")  # "Label: value" lines
+
+# Lines kept from the top of every report (letterheads carry provider/carrier details without labels)
+HEAD_LINES = 12
+# Lines kept either side of a matching line (values often sit on the line below their label)
+CONTEXT_LINES = 1
+
+
+def _field_keywords(fields=None):
+    """
+    Keywords for the requested fields (template placeholder names), or for
+    REQUIRED_FIELDS and the TEMPLATE_TO_LLM_KEY fields when fields is None.
+    """
+    keywords = set()
+    if fields is None:
+        for field in REQUIRED_FIELDS:
+            keywords.update(w for w in field.lower().split("_") if len(w) > 2)
+            keywords.update(FIELD_SYNONYMS.get(field, []))
+        for template_key, llm_key in TEMPLATE_TO_LLM_KEY.items():
+            keywords.add(llm_key.lower())
+            keywords.update(FIELD_SYNONYMS.get(template_key, []))
+    else:
+        for field in fields:
+            words = field.strip().upper()
+            for prefix in PLACEHOLDER_PREFIXES:
+                if words.startswith(prefix):
+                    words = words[len(prefix):]
+            for word in words.lower().split("_"):
+                if len(word) > 2 and not word.isdigit():
+                    keywords.add(word)
+                keywords.update(WORD_SYNONYMS.get(word, []))
+            keywords.update(FIELD_SYNONYMS.get(rule_field(field), []))
+            keywords.update(FIELD_SYNONYMS.get(field.strip().upper(), []))
+    # Longest first so multi-word phrases are matched before their parts
+    return sorted(keywords, key=len, reverse=True)
+
+
+@functools.lru_cache(maxsize=32)
+def _keyword_pattern(fields=None):
+    keywords = _field_keywords(fields)
+    if not keywords:
+        return None
+    return re.compile(r"(?<![A-Za-z0-9])(?:" + "|".join(re.escape(k) for k in keywords) + r")(?![A-Za-z0-9])", re.I)
+
+
+KEYWORDS = _field_keywords()
+KEYWORD_PATTERN = _keyword_pattern()
+
+
+def score_line(line, keyword_pattern=KEYWORD_PATTERN):
+    """
+    Relevance score of a line: keyword hits weigh most, then value-shaped
+    patterns (dates, phones, ZIPs, ...), then a "Label: value" shape.
+    """
+    score = 2.0 * len(keyword_pattern.findall(line)) if keyword_pattern else 0.0
+    score += sum(1.0 for pattern in VALUE_PATTERNS if pattern.search(line))
+    if LABEL_PATTERN.match(line.strip()):
+        score += 0.5
+    return score
+
+
+def prefilter_text(text, max_tokens=None, fields=None):
+    """
+    Shrinks report text to the passages likely to hold the requested fields (e.g. the
+    template's placeholders), before it is put in the LLM prompt. Keywords come from the
+    words in the field names; without fields, REQUIRED_FIELDS and the TEMPLATE_TO_LLM_KEY
+    fields are used.
+    - Report separators ("---" / "<name>:") and the first HEAD_LINES lines of each report are always kept.
+    - Other lines are kept when score_line() > 0, plus CONTEXT_LINES around them.
+    - Lines repeated verbatim (page headers, photo captions) are kept only once.
+    - If max_tokens is given and the result is still larger, the lowest-scoring kept lines are dropped.
+    Page breaks are preserved between pages that keep any lines.
+    Returns (filtered_text, stats) with token and line counts before and after.
+    """
+    keyword_pattern = _keyword_pattern(tuple(sorted(fields)) if fields is not None else None)
+    lines = []  # (report index, page index, line)
+    report = -1
+    for page_index, page in enumerate(text.split(PAGE_BOUNDARY)):
+        for line in page.split("\n"):
+            if line.strip() == "---":
+                report += 1
+            lines.append((max(report, 0), page_index, line))
+
+    def normalized(i):
+        return re.sub(r"\s+", " ", lines[i][2].strip()).lower()
+
+    keep = {}  # line index -> score; float("inf") for lines that are always kept
+    kept_lines = set()  # normalized text of kept lines, to drop verbatim repeats
+    position = {}  # non-blank lines seen so far per report
+    for i, (report_index, _, line) in enumerate(lines):
+        if not line.strip():
+            continue
+        position[report_index] = position.get(report_index, 0) + 1
+        if line.strip() == "---" or (i > 0 and lines[i - 1][2].strip() == "---"):
+            keep[i] = float("inf")
+            continue
+        text_i = normalized(i)
+        if text_i in kept_lines:
+            continue
+        score = float("inf") if position[report_index] <= HEAD_LINES else score_line(line, keyword_pattern)
+        if score > 0:
+            keep[i] = score
+            kept_lines.add(text_i)
+
+    for i, score in list(keep.items()):
+        if score == float("inf"):
+            continue
+        for j in range(max(0, i - CONTEXT_LINES), min(len(lines), i + CONTEXT_LINES + 1)):
+            if j in keep or lines[j][0] != lines[i][0] or not lines[j][2].strip():
+                continue
+            text_j = normalized(j)
+            if text_j not in kept_lines:
+                keep[j] = score / 2
+                kept_lines.add(text_j)
+
+    if max_tokens is not None:
+        total = sum(estimate_tokens(lines[i][2]) + 1 for i in keep)
+        for i in sorted(keep, key=lambda k: (keep[k], -k)):
+            if total <= max_tokens:
+                break
+            if keep[i] == float("inf"):
+                continue
+            total -= estimate_tokens(lines[i][2]) + 1
+            del keep[i]
+
+    pages = {}
+    for i in sorted(keep):
+        _, page_index, line = lines[i]
+        pages.setdefault(page_index, []).append(line.strip())
+    filtered = PAGE_BOUNDARY.join("\n".join(page_lines) for _, page_lines in sorted(pages.items()))
+    if text.startswith("\n"):
+        filtered = "\n" + filtered
+    stats = {
+        "tokens_before": estimate_tokens(text),
+        "tokens_after": estimate_tokens(filtered),
+        "lines_before": sum(1 for _, _, line in lines if line.strip()),
+        "lines_after": len(keep),
+    }
+    return filtered, stats
@@ -0,0 +1,51 @@
+import io
+import zipfile
+
+import docx
+
+from docx_utlis import compile_template, DocxTemplate, missing_placeholders
+
+
+def _template():
+    document = docx.Document()
+    paragraph = document.add_paragraph("Insured: ")
+    for text in ("[INSU", "RED_", "NAME]", " lives here"):  # one placeholder split across runs, as Word does
+        paragraph.add_run(text)
+    document.add_paragraph("[ ] Roof inspected   [X] Interior inspected")
+    document.sections[0].header.paragraphs[0].text = "Policy {{POLICY_NO}}"
+    document.sections[0].footer.paragraphs[0].text = "Report for [INSURED_NAME]"
+    outer = document.add_table(rows=1, cols=1).cell(0, 0)
+    outer.add_table(rows=1, cols=1).cell(0, 0).paragraphs[0].text = "Date of loss: [DATE_LOSS]"
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def _part_text(data, part):
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        return zf.read(part).decode("utf-8")
+
+
+def test_placeholders_are_indexed_everywhere_and_checkboxes_are_not():
+    template = DocxTemplate(_template())
+    assert template.placeholders == ["DATE_LOSS", "INSURED_NAME", "POLICY_NO"]
+
+
+def test_fill_replaces_split_header_footer_and_nested_table_placeholders():
+    values = {"INSURED_NAME": "Richard Daly", "POLICY_NO": "014646994-95A", "Date Taken": "9/28/2024"}
+    buffer, missing = compile_template(_template()).fill(values)
+    filled = docx.Document(buffer)
+    assert missing == set()
+    assert filled.paragraphs[0].text == "Insured: Richard Daly lives here"
+    assert filled.paragraphs[1].text == "[ ] Roof inspected   [X] Interior inspected"
+    assert filled.sections[0].header.paragraphs[0].text == "Policy 014646994-95A"
+    assert filled.sections[0].footer.paragraphs[0].text == "Report for Richard Daly"
+    assert filled.tables[0].cell(0, 0).tables[0].cell(0, 0).text == "Date of loss: 9/28/2024"
+    assert "INSURED_NAME" not in _part_text(buffer.getvalue(), "word/document.xml")
+
+
+def test_missing_values_are_left_in_place_and_reported():
+    buffer, missing = compile_template(_template()).fill({"INSURED_NAME": "Richard Daly"})
+    assert missing == {"DATE_LOSS", "POLICY_NO"}
+    assert missing_placeholders(["INSURED_NAME", "POLICY_NO"], {"insured_name": "Richard Daly"}) == ["POLICY_NO"]
+    assert docx.Document(buffer).sections[0].header.paragraphs[0].text == "Policy {{POLICY_NO}}"
@@ -0,0 +1,38 @@
+import pytest
+
+from field_rules import extract_fields, pairs_for_placeholders
+
+
+@pytest.mark.parametrize("line, name", [
+    ("Insured: NEW ZION HILL MISSIONARY BAPTIST CHURCH INCORPORATED", "NEW ZION HILL MISSIONARY BAPTIST CHURCH INCORPORATED"),
+    ("Insured: Mary Ann De La Cruz Smith", "Mary Ann De La Cruz Smith"),
+    ("Insured: Richard Daly     Claim #: 123", "Richard Daly"),
+])
+def test_labelled_names_are_taken_whole(line, name):
+    pairs, _ = extract_fields(line)
+    assert pairs["INSURED_NAME"] == name
+
+
+def test_names_that_only_partly_look_like_names_are_left_for_the_llm():
+    pairs, details = extract_fields("Insured: Mary Ann de la Cruz")
+    assert "INSURED_NAME" not in pairs and "INSURED_NAME" not in details
+
+
+def test_ids_are_not_truncated():
+    pairs, _ = extract_fields("Policy #: HO12345abc")
+    assert "POLICY_NO" not in pairs
+    pairs, _ = extract_fields("Policy Number: 014646994-95A, Claim 77")
+    assert pairs["POLICY_NO"] == "014646994-95A"
+
+
+def test_ids_cut_out_of_glued_text_are_not_trusted():
+    pairs, details = extract_fields("Policy #: 014646994-95AAlacrity Solutions")
+    assert "POLICY_NO" not in pairs
+    assert details["POLICY_NO"]["status"] == "low confidence"
+    assert details["POLICY_NO"]["candidates"][0]["value"] == "014646994-95A"
+
+
+def test_values_are_copied_onto_template_placeholders():
+    pairs, _ = extract_fields("Location of Loss: 12 Oak St, Springfield, IL 62704")
+    assert pairs_for_placeholders(pairs, ["XM8_INSURED_P_ZIP", "XM8_INSURED_P_CITY"]) == {
+        "XM8_INSURED_P_ZIP": "62704", "XM8_INSURED_P_CITY": "Springfield"}
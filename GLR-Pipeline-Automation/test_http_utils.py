@@ -0,0 +1,133 @@
+import pytest
+import requests
+
+from http_utils import OpenRouterClient, RateLimiter, parse_retry_after
+from mock_openrouter import MockOpenRouter
+
+PAYLOAD = {"model": "mock", "messages": [{"role": "user", "content": "report"}]}
+
+
+def make_client(**kwargs):
+    """
+    Client without a rate limit whose sleeps are recorded and advance a fake clock.
+    """
+    now = [100.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    client = OpenRouterClient(requests_per_minute=0, clock=lambda: now[0], sleep=sleep, **kwargs)
+    return client, sleeps
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_retries_transient_failures(status):
+    client, sleeps = make_client()
+    with MockOpenRouter(fail_first=2, fail_status=status, retry_after=None) as server:
+        result, retries = client.chat_completion(server.url, "key", PAYLOAD)
+    assert retries == 2
+    assert server.requests == 3
+    assert result["choices"][0]["message"]["content"]
+    assert len(sleeps) == 2
+    assert client.stats["retries"] == 2
+
+
+def test_honours_retry_after():
+    client, sleeps = make_client()
+    with MockOpenRouter(fail_first=1, retry_after="7") as server:
+        client.chat_completion(server.url, "key", PAYLOAD)
+    assert sleeps == [7.0]
+
+
+def test_retry_after_is_waited_in_full():
+    client, sleeps = make_client(backoff_max=3.0)
+    with MockOpenRouter(fail_first=1, retry_after="60") as server:
+        client.chat_completion(server.url, "key", PAYLOAD)
+    assert sleeps == [60.0]
+    assert server.requests == 2
+
+
+def test_retry_after_holds_back_other_callers():
+    client, _ = make_client()
+    sleep = client._sleep
+    others = []
+
+    def sleep_while_another_thread_asks_for_a_slot(seconds):
+        if not others:
+            others.append(client.rate_limiter.acquire())
+        sleep(seconds)
+
+    client._sleep = sleep_while_another_thread_asks_for_a_slot
+    with MockOpenRouter(fail_first=1, retry_after="7") as server:
+        client.chat_completion(server.url, "key", PAYLOAD)
+    assert others == [7.0]
+
+
+def test_long_retry_after_fails_fast():
+    client, sleeps = make_client(max_retry_after=30.0)
+    with MockOpenRouter(fail_first=1, retry_after="3600") as server:
+        with pytest.raises(requests.HTTPError) as error:
+            client.chat_completion(server.url, "key", PAYLOAD)
+    assert error.value.retries == 0
+    assert server.requests == 1
+    assert sleeps == []
+
+
+def test_unauthorized_fails_immediately():
+    client, sleeps = make_client()
+    with MockOpenRouter(fail_first=1, fail_status=401) as server:
+        with pytest.raises(requests.HTTPError) as error:
+            client.chat_completion(server.url, "bad-key", PAYLOAD)
+    assert error.value.retries == 0
+    assert server.requests == 1
+    assert sleeps == []
+
+
+def test_gives_up_after_max_retries():
+    client, sleeps = make_client(max_retries=2)
+    with MockOpenRouter(fail_first=10, fail_status=503, retry_after=None) as server:
+        with pytest.raises(requests.HTTPError) as error:
+            client.chat_completion(server.url, "key", PAYLOAD)
+    assert error.value.retries == 2
+    assert server.requests == 3
+    assert len(sleeps) == 2
+
+
+def test_backoff_is_jittered_and_capped():
+    client, _ = make_client(backoff_base=1.0, backoff_max=5.0)
+    for attempt in range(8):
+        delay = client.backoff_delay(attempt)
+        assert 0 <= delay <= min(5.0, 2 ** attempt)
+
+
+def test_rate_limiter_spaces_calls():
+    now = [100.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    limiter = RateLimiter(120, clock=lambda: now[0], sleep=sleep)  # one call per 0.5 s
+    waits = [limiter.acquire() for _ in range(4)]
+    assert waits == [0.0, 0.5, 0.5, 0.5]
+    assert sleeps == [0.5, 0.5, 0.5]
+
+    now[0] += 10  # idle time isn't banked as a burst
+    assert limiter.acquire() == 0.0
+    assert limiter.acquire() == 0.5
+
+
+def test_rate_limiter_disabled():
+    limiter = RateLimiter(0, clock=lambda: 0.0, sleep=lambda s: pytest.fail("should not sleep"))
+    assert [limiter.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("-1") == 0.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0  # in the past
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
@@ -0,0 +1,63 @@
+import pytest
+
+import http_utils
+import llm_utils
+from metrics_utils import PipelineMetrics
+from mock_openrouter import MockOpenRouter
+
+
+@pytest.fixture
+def server(monkeypatch):
+    with MockOpenRouter() as mock:
+        monkeypatch.setattr(llm_utils, "OPENROUTER_URL", mock.url)
+        # No rate limit and near-instant backoff, so tests don't wait on the API budget
+        monkeypatch.setattr(http_utils, "_client", http_utils.OpenRouterClient(requests_per_minute=0, backoff_base=0.01))
+        yield mock
+
+
+def test_empty_values_are_dropped_and_not_cached(server):
+    server.reply = {"DATE_LOSS": "", "TOL_CODE": ""}
+    pairs, _ = llm_utils.extract_key_value_pairs("report", "key", fields=["DATE_LOSS", "TOL_CODE"])
+    assert pairs == {}
+    llm_utils.extract_key_value_pairs("report", "key", fields=["DATE_LOSS", "TOL_CODE"])
+    assert server.requests == 2
+
+
+def test_unfound_fields_stay_missing_after_rules(server):
+    server.reply = {"DATE_LOSS": "9/28/2024", "TOL_CODE": ""}
+    pairs, _, _ = llm_utils.extract_key_value_pairs_with_rules(
+        "Insured: Richard Daly\n", "key", fields=["INSURED_NAME", "DATE_LOSS", "TOL_CODE"], use_cache=False)
+    assert pairs == {"INSURED_NAME": "Richard Daly", "DATE_LOSS": "9/28/2024"}
+    assert "Extract the following fields from the insurance report text below: DATE_LOSS, TOL_CODE." in server.prompts[0]
+
+
+def test_failed_chunk_is_reported_as_an_error(server):
+    server.reply = {"DATE_LOSS": "9/28/2024"}
+    server.fail_first = 1
+    server.fail_status = 401  # not retried
+    text = "\n---\na.pdf:\n" + "x " * 4000 + "\n---\nb.pdf:\n" + "y " * 4000
+    pairs, raw = llm_utils.extract_key_value_pairs_chunked(text, "key", max_chunk_tokens=1500, max_concurrency=1,
+                                                           use_cache=False)
+    assert pairs == {"DATE_LOSS": "9/28/2024"}
+    assert llm_utils.is_api_error(raw)
+    assert raw.startswith("API Error: 1 of ")
+
+
+def test_metrics_record_retries_of_failed_calls(server):
+    server.fail_first = 10
+    server.fail_status = 503
+    metrics = PipelineMetrics("claim")
+    pairs, raw = llm_utils.extract_key_value_pairs("report", "key", use_cache=False, metrics=metrics)
+    assert pairs == {} and llm_utils.is_api_error(raw)
+    assert server.requests == 5  # first try + max_retries (4)
+    assert metrics.llm_calls[0]["retries"] == 4
+    assert metrics.counters["llm_retries"] == 4
+    assert metrics.counters["llm_errors"] == 1
+
+
+def test_metrics_record_usage_tokens(server):
+    metrics = PipelineMetrics("claim")
+    llm_utils.extract_key_value_pairs("report", "key", use_cache=False, metrics=metrics)
+    call = metrics.llm_calls[0]
+    assert call["prompt_tokens"] > 0 and call["completion_tokens"] > 0 and call["retries"] == 0
+    assert metrics.counters["prompt_tokens"] == call["prompt_tokens"]
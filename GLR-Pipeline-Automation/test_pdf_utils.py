@@ -0,0 +1,144 @@
+import io
+import os
+from concurrent.futures import Future
+
+import fitz  # PyMuPDF
+import pytesseract
+
+import pdf_utils
+from metrics_utils import PipelineMetrics
+from pdf_utils import extract_text_from_pdf, ocr_cache
+
+
+def _form_wrapped_pdf(text):
+    """
+    One-page PDF whose content stream is only "/fzFrm0 Do": the text lives in a Form XObject.
+    """
+    src = fitz.open()
+    src.new_page().insert_text((72, 72), text)
+    out = fitz.open()
+    page = out.new_page()
+    page.show_pdf_page(page.rect, src, 0)
+    return io.BytesIO(out.tobytes())
+
+
+def test_form_xobject_pages_are_not_confused_by_the_cache():
+    first, _ = extract_text_from_pdf(_form_wrapped_pdf("POLICY NUMBER 111111"))
+    second, _ = extract_text_from_pdf(_form_wrapped_pdf("POLICY NUMBER 999999"))
+    assert "111111" in first
+    assert "999999" in second
+
+
+def test_unchanged_page_is_served_from_cache():
+    before = ocr_cache.stats.copy()
+    pdf = _form_wrapped_pdf("INSURED JANE DOE")
+    first, _ = extract_text_from_pdf(pdf)
+    second, _ = extract_text_from_pdf(pdf)
+    assert first == second
+    assert (ocr_cache.stats.copy() - before).hits == 1
+
+
+def test_array_contents_pages_are_cached():
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 72), "DATE OF LOSS 9/28/2024")
+    page.insert_text((72, 144), "CLAIM 014646994")  # a second insert adds a second content stream
+    pdf = io.BytesIO(doc.tobytes())
+    before = ocr_cache.stats.copy()
+    extract_text_from_pdf(pdf)
+    text, _ = extract_text_from_pdf(pdf)
+    assert "014646994" in text
+    assert (ocr_cache.stats.copy() - before).hits == 1
+
+
+class _RecordingPool:
+    """
+    Stands in for the OCR process pool: runs each job on submit and tracks how many
+    results are still waiting to be collected.
+    """
+    def __init__(self):
+        self.waiting = 0
+        self.most_waiting = 0
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        pool = self
+        self.waiting += 1
+        self.most_waiting = max(self.most_waiting, self.waiting)
+        result = future.result
+
+        def collect():
+            pool.waiting -= 1
+            return result()
+        future.result = collect
+        return future
+
+
+def test_ocr_keeps_a_bounded_number_of_pages_in_flight(monkeypatch):
+    pool = _RecordingPool()
+    monkeypatch.setattr(pdf_utils, "_get_ocr_pool", lambda: pool)
+    monkeypatch.setattr(pdf_utils, "_ocr_page", lambda width, height, samples, cmd: (f"{len(samples)} bytes", 0.0))
+    monkeypatch.setattr(os, "cpu_count", lambda: 1)
+    doc = fitz.open()
+    for _ in range(7):
+        doc.new_page()  # no text layer, so every page goes to OCR
+    text, warnings = extract_text_from_pdf(io.BytesIO(doc.tobytes()), dpi=20, use_cache=False)
+    assert warnings == []
+    assert text.count("bytes") == 7
+    assert pool.waiting == 0
+    assert pool.most_waiting == pdf_utils.OCR_PAGES_PER_WORKER
+
+
+def test_ocr_failures_are_counted(monkeypatch):
+    def no_tesseract(width, height, samples, cmd):
+        raise OSError("tesseract is not installed")
+    monkeypatch.setattr(pdf_utils, "_ocr_page", no_tesseract)
+    doc = fitz.open()
+    doc.new_page()
+    doc.new_page().insert_text((72, 72), "CLAIM 014646994")
+    metrics = PipelineMetrics("claim")
+    text, warnings = extract_text_from_pdf(io.BytesIO(doc.tobytes()), dpi=20, use_cache=False, metrics=metrics)
+    assert "014646994" in text
+    assert warnings == ["OCR failed on page 1: tesseract is not installed"]
+    assert metrics.counters["ocr_pages"] == 1
+    assert metrics.counters["ocr_failures"] == 1
+
+
+def test_missing_tesseract_does_not_break_the_ocr_pool(monkeypatch):
+    monkeypatch.setattr(pytesseract.pytesseract, "tesseract_cmd", "/nonexistent/tesseract")
+    doc = fitz.open()
+    doc.new_page()
+    doc.new_page()  # two image-only pages, so they go to the shared process pool
+    pdf = io.BytesIO(doc.tobytes())
+    for _ in range(2):  # the second run must still reach Tesseract, not a dead pool
+        _, warnings = extract_text_from_pdf(pdf, dpi=20, use_cache=False)
+        assert len(warnings) == 3
+        for page, warning in enumerate(warnings[:2], 1):
+            assert warning.startswith(f"OCR failed on page {page}: ")
+            assert "tesseract is not installed" in warning
+
+
+def test_cached_ocr_pages_are_not_rendered_again(monkeypatch):
+    rendered = []
+    render_page = pdf_utils._render_page
+    monkeypatch.setattr(pdf_utils, "_render_page", lambda doc, i, dpi: rendered.append(i) or render_page(doc, i, dpi))
+    monkeypatch.setattr(pdf_utils, "_ocr_page", lambda width, height, samples, cmd: ("DATE OF LOSS 9/28/2024", 0.0))
+    doc = fitz.open()
+    for n in range(2):  # image-only pages: drawings, no text layer
+        doc.new_page().draw_rect(fitz.Rect(10, 10, 50 + n, 50 + id(rendered) % 500))
+    pdf = io.BytesIO(doc.tobytes())
+
+    before = ocr_cache.stats.copy()
+    extract_text_from_pdf(pdf, dpi=20, max_workers=1)
+    middle = ocr_cache.stats.copy()
+    first = middle - before
+    assert rendered == [0, 1]
+    assert (first.hits, first.misses) == (0, 2)
+
+    rendered.clear()
+    text, _ = extract_text_from_pdf(pdf, dpi=20, max_workers=1)
+    second = ocr_cache.stats.copy() - middle
+    assert text.count("9/28/2024") == 2
+    assert rendered == []
+    assert (second.hits, second.misses) == (2, 0)
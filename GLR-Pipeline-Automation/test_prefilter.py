@@ -0,0 +1,24 @@
+from prefilter import HEAD_LINES, prefilter_text
+
+FILLER = [f"Photo {n} of the north elevation facing the yard" for n in range(HEAD_LINES + 5)]
+TRAILER = [f"Close-up {n} of the gutter" for n in range(5)]
+
+
+def report(*lines):
+    return "\n".join(["---", "photo report.pdf:", *FILLER, *lines, *TRAILER])
+
+
+def test_labelled_value_survives_filtering():
+    filtered, stats = prefilter_text(report("Policy #: 014646994-95A"))
+    assert "Policy #: 014646994-95A" in filtered
+    assert stats["lines_after"] < stats["lines_before"]
+
+
+def test_keywords_come_from_the_requested_placeholders():
+    text = report("Actual Cash Value 7,653.09", "Estimator Steven Kujawski")
+    default, _ = prefilter_text(text)
+    assert "7,653.09" not in default and "Kujawski" not in default
+    filtered, _ = prefilter_text(text, fields=["XM8_LR_ACV_CLAIM", "XM8_ESTIMATOR_NAME"])
+    assert "Actual Cash Value 7,653.09" in filtered
+    assert "Estimator Steven Kujawski" in filtered
+    assert FILLER[-3] not in filtered and TRAILER[-1] not in filtered
@@ -6,15 +6,17 @@ from tkinter import filedialog, messagebox, ttk
 from PIL import Image, ImageTk
 import threading
 import webbrowser
+from collections import OrderedDict
 
 # Always use this output directory
 OUTPUT_DIR = 'task_2_output-images'
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 # --- Change Detection Logic as a Function ---
-def process_image_pair(before_path, after_path):
-    before_img = cv2.imread(before_path)
-    after_img = cv2.imread(after_path)
+def detect_change_regions(before_img, after_img, min_area=100):
+    """
+    Returns the bounding boxes (x, y, w, h) of regions that differ between two BGR images.
+    """
     before_gray = cv2.cvtColor(before_img, cv2.COLOR_BGR2GRAY)
     after_gray = cv2.cvtColor(after_img, cv2.COLOR_BGR2GRAY)
     diff = cv2.absdiff(before_gray, after_gray)
@@ -23,13 +25,212 @@ def process_image_pair(before_path, after_path):
     thresh = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
     thresh = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel)
     contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    output_img = after_img.copy()
-    for cnt in contours:
-        if cv2.contourArea(cnt) > 100:
-            x, y, w, h = cv2.boundingRect(cnt)
-            cv2.rectangle(output_img, (x, y), (x+w, y+h), (0, 0, 255), 4)  # Bright red, thickness 4
+    return [cv2.boundingRect(cnt) for cnt in contours if cv2.contourArea(cnt) > min_area]
+
+def draw_change_regions(img, regions):
+    """
+    Returns a copy of img with each region outlined in red.
+    """
+    output_img = img.copy()
+    for x, y, w, h in regions:
+        cv2.rectangle(output_img, (x, y), (x+w, y+h), (0, 0, 255), 4)  # Bright red, thickness 4
+    return output_img
+
+def process_image_pair(before_path, after_path):
+    before_img = cv2.imread(before_path)
+    after_img = cv2.imread(after_path)
+    regions = detect_change_regions(before_img, after_img)
+    output_img = draw_change_regions(after_img, regions)
     return before_img, after_img, output_img
 
+# --- Tile Pyramid for the Zoom Viewer ---
+TILE_SIZE = 256
+# Outputs whose pyramids are kept for reopening the zoom view; older ones are dropped
+PYRAMID_CACHE_SIZE = 3
+
+class TilePyramid:
+    """
+    Multi-resolution tile pyramid of an image, built once per output.
+    Level 0 is full resolution and each following level halves the size.
+    Tiles are stored JPEG-encoded and only decoded when they become visible.
+    """
+    def __init__(self, img, tile_size=TILE_SIZE, cache_tiles=64):
+        self.tile_size = tile_size
+        self.height, self.width = img.shape[:2]
+        self.levels = []  # (width, height, {(tx, ty): jpeg_bytes})
+        level_img = img
+        while True:
+            h, w = level_img.shape[:2]
+            tiles = {}
+            for ty in range((h + tile_size - 1) // tile_size):
+                for tx in range((w + tile_size - 1) // tile_size):
+                    tile = level_img[ty*tile_size:(ty+1)*tile_size, tx*tile_size:(tx+1)*tile_size]
+                    ok, buf = cv2.imencode('.jpg', tile, [cv2.IMWRITE_JPEG_QUALITY, 95])
+                    if not ok:
+                        raise ValueError(f'Could not encode tile {tx},{ty} at level {len(self.levels)}')
+                    tiles[(tx, ty)] = buf.tobytes()
+            self.levels.append((w, h, tiles))
+            if w <= tile_size and h <= tile_size:
+                break
+            level_img = cv2.resize(level_img, ((w + 1) // 2, (h + 1) // 2), interpolation=cv2.INTER_AREA)
+        self._decoded = OrderedDict()
+        self._cache_tiles = cache_tiles
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        img = cv2.imread(path)
+        if img is None:
+            raise ValueError(f'Could not read image: {path}')
+        return cls(img, **kwargs)
+
+    def level_for_zoom(self, zoom):
+        """
+        Picks the smallest level that still has at least one source pixel per screen pixel.
+        """
+        level = 0
+        while level + 1 < len(self.levels) and zoom <= 0.5 ** (level + 1):
+            level += 1
+        return level
+
+    def tile(self, level, tx, ty):
+        """
+        Returns a tile as an RGB PIL image, keeping recently used tiles decoded.
+        """
+        key = (level, tx, ty)
+        if key in self._decoded:
+            self._decoded.move_to_end(key)
+            return self._decoded[key]
+        buf = np.frombuffer(self.levels[level][2][(tx, ty)], np.uint8)
+        tile = cv2.cvtColor(cv2.imdecode(buf, cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+        img = Image.fromarray(tile)
+        self._decoded[key] = img
+        if len(self._decoded) > self._cache_tiles:
+            self._decoded.popitem(last=False)
+        return img
+
+class ZoomViewer(tk.Toplevel):
+    """
+    Pan/zoom window for a TilePyramid. Only tiles intersecting the viewport are drawn.
+    Drag to pan, mouse wheel or +/- to zoom, 0 to fit.
+    """
+    MAX_ZOOM = 8.0
+
+    def __init__(self, master, pyramid, title='Detected Changes'):
+        super().__init__(master)
+        self.title(title)
+        self.geometry('900x650')
+        self.configure(bg='#ffffff')
+        self.pyramid = pyramid
+        self.zoom = 1.0
+        self.offset_x = 0.0  # top-left of the viewport in zoomed image coordinates
+        self.offset_y = 0.0
+        self.drag_start = None
+        self.items = {}  # (tx, ty) -> (canvas item, PhotoImage) at the current zoom
+        self.canvas = tk.Canvas(self, bg='#212121', highlightthickness=0)
+        self.canvas.pack(fill='both', expand=True)
+        self.info = tk.Label(self, text='', bg='#ffffff', fg='#222222', font=('Segoe UI', 10))
+        self.info.pack(fill='x')
+        self.canvas.bind('<Configure>', self.on_configure)
+        self.canvas.bind('<ButtonPress-1>', self.on_press)
+        self.canvas.bind('<B1-Motion>', self.on_drag)
+        self.canvas.bind('<MouseWheel>', self.on_wheel)
+        self.canvas.bind('<Button-4>', lambda e: self.zoom_at(e.x, e.y, 1.25))
+        self.canvas.bind('<Button-5>', lambda e: self.zoom_at(e.x, e.y, 0.8))
+        self.bind('<plus>', lambda e: self.zoom_center(1.25))
+        self.bind('<equal>', lambda e: self.zoom_center(1.25))
+        self.bind('<minus>', lambda e: self.zoom_center(0.8))
+        self.bind('<Key-0>', lambda e: self.fit())
+        self.fitted = False
+
+    def fit_zoom(self):
+        cw, ch = max(self.canvas.winfo_width(), 1), max(self.canvas.winfo_height(), 1)
+        return min(cw / self.pyramid.width, ch / self.pyramid.height, 1.0)
+
+    def fit(self):
+        self.zoom = self.fit_zoom()
+        cw, ch = self.canvas.winfo_width(), self.canvas.winfo_height()
+        self.offset_x = (self.pyramid.width * self.zoom - cw) / 2
+        self.offset_y = (self.pyramid.height * self.zoom - ch) / 2
+        self.clear_tiles()
+        self.render()
+
+    def on_configure(self, event):
+        if not self.fitted:
+            self.fitted = True
+            self.fit()
+        else:
+            self.render()
+
+    def on_press(self, event):
+        self.drag_start = (event.x, event.y)
+
+    def on_drag(self, event):
+        if self.drag_start is None:
+            return
+        dx, dy = event.x - self.drag_start[0], event.y - self.drag_start[1]
+        self.drag_start = (event.x, event.y)
+        self.offset_x -= dx
+        self.offset_y -= dy
+        self.canvas.move('tile', dx, dy)
+        self.render()
+
+    def on_wheel(self, event):
+        self.zoom_at(event.x, event.y, 1.25 if event.delta > 0 else 0.8)
+
+    def zoom_center(self, factor):
+        self.zoom_at(self.canvas.winfo_width() / 2, self.canvas.winfo_height() / 2, factor)
+
+    def zoom_at(self, x, y, factor):
+        new_zoom = min(max(self.zoom * factor, min(self.fit_zoom(), 1.0) / 2), self.MAX_ZOOM)
+        if new_zoom == self.zoom:
+            return
+        # Keep the image point under the cursor fixed
+        image_x = (self.offset_x + x) / self.zoom
+        image_y = (self.offset_y + y) / self.zoom
+        self.zoom = new_zoom
+        self.offset_x = image_x * new_zoom - x
+        self.offset_y = image_y * new_zoom - y
+        self.clear_tiles()
+        self.render()
+
+    def clear_tiles(self):
+        self.canvas.delete('tile')
+        self.items = {}
+
+    def render(self):
+        cw, ch = self.canvas.winfo_width(), self.canvas.winfo_height()
+        level = self.pyramid.level_for_zoom(self.zoom)
+        lw, lh, tiles = self.pyramid.levels[level]
+        ts = self.pyramid.tile_size
+        # Screen pixels per level pixel
+        fx = self.zoom * self.pyramid.width / lw
+        fy = self.zoom * self.pyramid.height / lh
+        tx0 = max(int(self.offset_x / fx) // ts, 0)
+        ty0 = max(int(self.offset_y / fy) // ts, 0)
+        tx1 = min(int((self.offset_x + cw) / fx) // ts, (lw - 1) // ts)
+        ty1 = min(int((self.offset_y + ch) / fy) // ts, (lh - 1) // ts)
+        visible = set()
+        for ty in range(ty0, ty1 + 1):
+            for tx in range(tx0, tx1 + 1):
+                visible.add((tx, ty))
+                if (tx, ty) in self.items:
+                    continue
+                # Round tile edges (not sizes) so neighbouring tiles meet without gaps
+                x0, x1 = round(tx * ts * fx), round(min((tx + 1) * ts, lw) * fx)
+                y0, y1 = round(ty * ts * fy), round(min((ty + 1) * ts, lh) * fy)
+                if x1 <= x0 or y1 <= y0:
+                    continue
+                tile = self.pyramid.tile(level, tx, ty)
+                resample = Image.NEAREST if fx > 1 else Image.BILINEAR
+                photo = ImageTk.PhotoImage(tile.resize((x1 - x0, y1 - y0), resample))
+                item = self.canvas.create_image(x0 - self.offset_x, y0 - self.offset_y, image=photo, anchor='nw', tags='tile')
+                self.items[(tx, ty)] = (item, photo)
+        for key in list(self.items):
+            if key not in visible:
+                self.canvas.delete(self.items.pop(key)[0])
+        self.info.config(text=f'Zoom {self.zoom * 100:.0f}%  |  level {level}  |  {len(self.items)} tiles  |  '
+                              f'{self.pyramid.width}x{self.pyramid.height}  |  drag to pan, wheel or +/- to zoom, 0 to fit')
+
 # --- Tkinter GUI ---
 class ChangeDetectionApp:
     def __init__(self, root):
@@ -48,6 +249,8 @@ class ChangeDetectionApp:
         self.processing = False
         self.cancel_requested = False
         self.errors = 0
+        self.pyramids = OrderedDict()  # output path -> (mtime, TilePyramid), least recently used first
+        self.pyramid_builds = set()  # output paths whose pyramid is being built
 
         # --- Simple Color Palette ---
         self.colors = {
@@ -160,6 +363,7 @@ class ChangeDetectionApp:
             self.process_btn.config(state='normal')
             self.show_status(f'Selected: {self.input_dir}', 'info')
             self.image_pairs = self.get_image_pairs()
+            self.pyramids.clear()
             self.current_index = 0
             self.prev_btn.config(state='disabled')
             self.next_btn.config(state='disabled')
@@ -278,13 +482,43 @@ class ChangeDetectionApp:
         before, after = self.image_pairs[self.current_index]
         out_path = os.path.join(OUTPUT_DIR, after)
         try:
-            if os.name == 'nt':
-                os.startfile(out_path)
-            elif os.name == 'posix':
-                opener = 'open' if sys.platform == 'darwin' else 'xdg-open'
-                os.system(f'{opener} "{out_path}"')
+            # Build the pyramid once per output; rebuild only if the file was rewritten
+            mtime = os.path.getmtime(out_path)
         except Exception as e:
             self.show_status(f'Could not open image: {e}', 'error')
+            return
+        cached = self.pyramids.get(out_path)
+        if cached is not None and cached[0] == mtime:
+            self.pyramids.move_to_end(out_path)
+            ZoomViewer(self.root, cached[1], title=f'Detected Changes - {after}')
+            return
+        if out_path in self.pyramid_builds:
+            return  # the viewer opens when the running build finishes
+        # Large outputs take seconds to tile; build off the Tk main thread so the UI stays responsive
+        self.pyramid_builds.add(out_path)
+        self.show_status('Preparing zoom view...', 'info')
+        threading.Thread(target=self._build_pyramid, args=(out_path, mtime, after), daemon=True).start()
+
+    def _build_pyramid(self, out_path, mtime, after):
+        try:
+            pyramid = TilePyramid.from_file(out_path)
+        except Exception as e:
+            self.root.after(0, self._pyramid_failed, out_path, e)
+            return
+        self.root.after(0, self._open_pyramid, out_path, mtime, pyramid, after)
+
+    def _open_pyramid(self, out_path, mtime, pyramid, after):
+        self.pyramid_builds.discard(out_path)
+        self.pyramids[out_path] = (mtime, pyramid)
+        self.pyramids.move_to_end(out_path)
+        while len(self.pyramids) > PYRAMID_CACHE_SIZE:
+            self.pyramids.popitem(last=False)
+        self.clear_status()
+        ZoomViewer(self.root, pyramid, title=f'Detected Changes - {after}')
+
+    def _pyramid_failed(self, out_path, error):
+        self.pyramid_builds.discard(out_path)
+        self.show_status(f'Could not open image: {error}', 'error')
 
     def show_help(self):
         msg = (
@@ -292,7 +526,7 @@ class ChangeDetectionApp:
             "1. Select a folder with before/after image pairs (e.g., '1.jpg' and '1~2.jpg').\n"
             "2. Click 'Process Images' to run change detection.\n"
             "3. Browse results with Prev/Next or arrow keys.\n"
-            "4. Click 'Zoom Output' to view the detected changes image.\n"
+            "4. Click 'Zoom Output' to pan/zoom the detected changes image (drag, mouse wheel, +/-, 0 to fit).\n"
             "5. Cancel processing anytime with the Cancel button.\n\n"
             "Output images are saved in the 'task_2_output-images' folder.\n\n"
             "Developed for your assessment.\n"
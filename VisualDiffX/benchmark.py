@@ -0,0 +1,215 @@
+"""
+Regression and throughput benchmark for the VisualDiffX change detector.
+
+Runs the detector over the bundled before/after pairs in T2-Input-images and
+reports per-stage latency, peak memory and pairs/second for several worker
+counts and image scales. At scale 1.0 the detected regions are also compared
+against the reference images in T2-Output-Images.
+
+Usage:
+    python benchmark.py
+    python benchmark.py --workers 1 2 4 --scales 0.5 1.0 2.0 --repeat 3
+"""
+import argparse
+import importlib.util
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+INPUT_DIR = os.path.join(HERE, 'T2-Input-images')
+REFERENCE_DIR = os.path.join(HERE, 'T2-Output-Images')
+
+
+def load_detector():
+    """
+    Imports 'VisualDiffX .py' (the filename contains a space, so a plain import won't do).
+    """
+    spec = importlib.util.spec_from_file_location('visualdiffx', os.path.join(HERE, 'VisualDiffX .py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def find_pairs(input_dir):
+    """
+    Returns (before_path, after_path) tuples using the app's 'N.jpg' / 'N~2.jpg' convention.
+    """
+    pairs = []
+    for name in sorted(os.listdir(input_dir)):
+        if not name.endswith('.jpg') or '~2' in name:
+            continue
+        after = f'{name[:-4]}~2.jpg'
+        if os.path.exists(os.path.join(input_dir, after)):
+            pairs.append((os.path.join(input_dir, name), os.path.join(input_dir, after)))
+    return pairs
+
+
+def scale_image(img, scale):
+    if scale == 1.0:
+        return img
+    interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+    return cv2.resize(img, None, fx=scale, fy=scale, interpolation=interpolation)
+
+
+def run_pair(detector, before_path, after_path, scale):
+    """
+    Runs one pair through the detector, returning (regions, output_img, stage_timings).
+    """
+    timings = {}
+    t0 = time.perf_counter()
+    before_img = scale_image(cv2.imread(before_path), scale)
+    after_img = scale_image(cv2.imread(after_path), scale)
+    t1 = time.perf_counter()
+    regions = detector.detect_change_regions(before_img, after_img)
+    t2 = time.perf_counter()
+    output_img = detector.draw_change_regions(after_img, regions)
+    t3 = time.perf_counter()
+    timings['decode'] = t1 - t0
+    timings['detect'] = t2 - t1
+    timings['draw'] = t3 - t2
+    return regions, output_img, timings
+
+
+# --- Correctness against reference outputs ---
+def red_box_mask(img):
+    """
+    Mask of the bright red outline pixels drawn by draw_change_regions (tolerant of JPEG noise).
+    """
+    b, g, r = cv2.split(img)
+    return (r > 200) & (g < 60) & (b < 60)
+
+
+def compare_to_reference(output_img, reference_img, tolerance_px):
+    """
+    Returns (recall, precision) of red outline pixels, allowing them to be off by tolerance_px.
+    """
+    ours = red_box_mask(output_img)
+    ref = red_box_mask(reference_img)
+    if not ours.any() and not ref.any():
+        return 1.0, 1.0
+    if not ours.any() or not ref.any():
+        return 0.0, 0.0
+    kernel = np.ones((2 * tolerance_px + 1, 2 * tolerance_px + 1), np.uint8)
+    ours_near = cv2.dilate(ours.astype(np.uint8), kernel).astype(bool)
+    ref_near = cv2.dilate(ref.astype(np.uint8), kernel).astype(bool)
+    recall = (ref & ours_near).sum() / ref.sum()
+    precision = (ours & ref_near).sum() / ours.sum()
+    return float(recall), float(precision)
+
+
+def check_regression(detector, pairs, tolerance_px, min_score):
+    print('== Regression check against T2-Output-Images ==')
+    failures = 0
+    checked = 0
+    for before_path, after_path in pairs:
+        name = os.path.basename(after_path)
+        ref_path = os.path.join(REFERENCE_DIR, name)
+        if not os.path.exists(ref_path):
+            print(f'  {name}: no reference output, skipped')
+            continue
+        regions, output_img, _ = run_pair(detector, before_path, after_path, 1.0)
+        reference_img = cv2.imread(ref_path)
+        if reference_img.shape != output_img.shape:
+            print(f'  {name}: FAIL shape {output_img.shape} != reference {reference_img.shape}')
+            failures += 1
+            checked += 1
+            continue
+        recall, precision = compare_to_reference(output_img, reference_img, tolerance_px)
+        ok = recall >= min_score and precision >= min_score
+        failures += 0 if ok else 1
+        checked += 1
+        status = 'ok  ' if ok else 'FAIL'
+        print(f'  {name}: {status} regions={len(regions)} recall={recall:.3f} precision={precision:.3f}')
+    print(f'  {checked - failures}/{checked} pairs match the reference (tolerance {tolerance_px}px, min score {min_score})')
+    return failures
+
+
+# --- Throughput ---
+def measure_stages(detector, pairs, scale, repeat):
+    """
+    Serial run to get per-stage latency and peak traced memory for one scale.
+    """
+    stage_times = {'decode': [], 'detect': [], 'draw': []}
+    tracemalloc.start()
+    for _ in range(repeat):
+        for before_path, after_path in pairs:
+            _, _, timings = run_pair(detector, before_path, after_path, scale)
+            for stage, value in timings.items():
+                stage_times[stage].append(value)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return stage_times, peak
+
+
+def measure_throughput(detector, pairs, scale, workers, repeat):
+    jobs = pairs * repeat
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda pair: run_pair(detector, pair[0], pair[1], scale), jobs))
+    elapsed = time.perf_counter() - start
+    return len(jobs) / elapsed
+
+
+def max_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def run_benchmark(detector, pairs, scales, worker_counts, repeat):
+    print('== Throughput ==')
+    for scale in scales:
+        stage_times, peak = measure_stages(detector, pairs, scale, repeat)
+        print(f'scale {scale:g}:')
+        for stage, values in stage_times.items():
+            print(f'  {stage:<7} mean {statistics.mean(values) * 1000:8.2f} ms   '
+                  f'p95 {sorted(values)[int(0.95 * (len(values) - 1))] * 1000:8.2f} ms')
+        print(f'  peak traced memory {peak / (1024 * 1024):.1f} MB')
+        for workers in worker_counts:
+            rate = measure_throughput(detector, pairs, scale, workers, repeat)
+            print(f'  workers={workers:<3} {rate:8.2f} pairs/s')
+    rss = max_rss_mb()
+    if rss is not None:
+        print(f'max RSS {rss:.1f} MB')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark VisualDiffX change detection on the bundled image pairs.')
+    parser.add_argument('--input-dir', default=INPUT_DIR)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--scales', type=float, nargs='+', default=[0.5, 1.0, 2.0])
+    parser.add_argument('--repeat', type=int, default=1, help='Times to run over the pair set per measurement.')
+    parser.add_argument('--tolerance', type=int, default=3, help='Allowed outline offset in pixels vs the reference.')
+    parser.add_argument('--min-score', type=float, default=0.95, help='Minimum recall/precision of outline pixels.')
+    parser.add_argument('--skip-regression', action='store_true')
+    parser.add_argument('--skip-throughput', action='store_true')
+    args = parser.parse_args(argv)
+
+    detector = load_detector()
+    pairs = find_pairs(args.input_dir)
+    if not pairs:
+        print(f'No image pairs found in {args.input_dir}')
+        return 1
+    print(f'{len(pairs)} image pairs from {args.input_dir}')
+
+    failures = 0
+    if not args.skip_regression:
+        failures = check_regression(detector, pairs, args.tolerance, args.min_score)
+    if not args.skip_throughput:
+        run_benchmark(detector, pairs, args.scales, args.workers, args.repeat)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())